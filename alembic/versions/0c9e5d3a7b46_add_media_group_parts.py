@@ -0,0 +1,40 @@
+"""Add media_group_parts
+
+Revision ID: 0c9e5d3a7b46
+Revises: f4a7b29c6d13
+Create Date: 2026-10-18 16:48:21.093517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0c9e5d3a7b46'
+down_revision: Union[str, Sequence[str], None] = 'f4a7b29c6d13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'media_group_parts',
+        sa.Column('media_group_id', sa.String(length=64), nullable=False),
+        sa.Column('message_id', sa.Integer(), nullable=False),
+        sa.Column('chat_id', sa.BigInteger(), nullable=False),
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        sa.Column('caption', sa.Text(), nullable=True),
+        sa.Column('caption_entities', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('file', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('received_at', sa.DateTime(), server_default=sa.text('LOCALTIMESTAMP'), nullable=False),
+        sa.PrimaryKeyConstraint('media_group_id', 'message_id'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('media_group_parts')
@@ -0,0 +1,35 @@
+"""Add last_reminded_at and reminder sweep index
+
+Revision ID: 2f8d0c6b7e14
+Revises: e91b6f3a8c25
+Create Date: 2026-10-18 13:20:11.604733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2f8d0c6b7e14'
+down_revision: Union[str, Sequence[str], None] = 'e91b6f3a8c25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('last_reminded_at', sa.DateTime(), nullable=True))
+    op.create_index(
+        'ix_users_reminder_due',
+        'users',
+        [sa.text('greatest(registered_at, last_reminded_at)')],
+        postgresql_where=sa.text('specialization IS NULL AND unreachable_at IS NULL'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_users_reminder_due', table_name='users')
+    op.drop_column('users', 'last_reminded_at')
@@ -0,0 +1,33 @@
+"""Make users.invite_link nullable
+
+Revision ID: 6a0d3f8e2b91
+Revises: 2f8d0c6b7e14
+Create Date: 2026-10-18 14:05:37.218406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6a0d3f8e2b91'
+down_revision: Union[str, Sequence[str], None] = '2f8d0c6b7e14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.alter_column('users', 'invite_link',
+               existing_type=sa.VARCHAR(length=512),
+               nullable=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("UPDATE users SET invite_link = '' WHERE invite_link IS NULL")
+    op.alter_column('users', 'invite_link',
+               existing_type=sa.VARCHAR(length=512),
+               nullable=False)
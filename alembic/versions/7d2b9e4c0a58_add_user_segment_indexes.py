@@ -0,0 +1,47 @@
+"""Add user segment indexes
+
+Revision ID: 7d2b9e4c0a58
+Revises: 0c9e5d3a7b46
+Create Date: 2026-10-18 17:05:42.318264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d2b9e4c0a58'
+down_revision: Union[str, Sequence[str], None] = '0c9e5d3a7b46'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY — чтобы не блокировать запись в users на время построения
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_users_specialization_reachable',
+            'users',
+            ['specialization', 'telegram_id'],
+            postgresql_where=sa.text('unreachable_at IS NULL'),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_users_registered_at_reachable',
+            'users',
+            ['registered_at'],
+            postgresql_where=sa.text('unreachable_at IS NULL'),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_registered_at_reachable', table_name='users', postgresql_concurrently=True)
+        op.drop_index('ix_users_specialization_reachable', table_name='users', postgresql_concurrently=True)
@@ -0,0 +1,30 @@
+"""Add broadcast progress message
+
+Revision ID: 8e3f41a6c2d7
+Revises: 5b1c2e7d9a40
+Create Date: 2026-10-18 11:02:47.215390
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e3f41a6c2d7'
+down_revision: Union[str, Sequence[str], None] = '5b1c2e7d9a40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('broadcast_jobs', sa.Column('progress_chat_id', sa.BigInteger(), nullable=True))
+    op.add_column('broadcast_jobs', sa.Column('progress_message_id', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('broadcast_jobs', 'progress_message_id')
+    op.drop_column('broadcast_jobs', 'progress_chat_id')
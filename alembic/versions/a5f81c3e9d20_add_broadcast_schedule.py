@@ -0,0 +1,32 @@
+"""Add broadcast schedule, delivery window and rate cap
+
+Revision ID: a5f81c3e9d20
+Revises: 7d2b9e4c0a58
+Create Date: 2026-10-18 18:12:37.540981
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a5f81c3e9d20'
+down_revision: Union[str, Sequence[str], None] = '7d2b9e4c0a58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('broadcast_jobs', sa.Column('scheduled_at', sa.DateTime(), nullable=True))
+    op.add_column('broadcast_jobs', sa.Column('window_seconds', sa.Integer(), nullable=True))
+    op.add_column('broadcast_jobs', sa.Column('max_rate', sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('broadcast_jobs', 'max_rate')
+    op.drop_column('broadcast_jobs', 'window_seconds')
+    op.drop_column('broadcast_jobs', 'scheduled_at')
@@ -0,0 +1,35 @@
+"""Add invite_links pool
+
+Revision ID: b3e5c1d97f02
+Revises: 6a0d3f8e2b91
+Create Date: 2026-10-18 14:41:52.730118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e5c1d97f02'
+down_revision: Union[str, Sequence[str], None] = '6a0d3f8e2b91'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'invite_links',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('link', sa.String(length=512), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('link'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('invite_links')
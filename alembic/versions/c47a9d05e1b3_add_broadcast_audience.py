@@ -0,0 +1,28 @@
+"""Add broadcast audience filter
+
+Revision ID: c47a9d05e1b3
+Revises: 8e3f41a6c2d7
+Create Date: 2026-10-18 11:48:09.730615
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c47a9d05e1b3'
+down_revision: Union[str, Sequence[str], None] = '8e3f41a6c2d7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('broadcast_jobs', sa.Column('audience', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('broadcast_jobs', 'audience')
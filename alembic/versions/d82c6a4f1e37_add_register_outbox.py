@@ -0,0 +1,40 @@
+"""Add register_outbox
+
+Revision ID: d82c6a4f1e37
+Revises: b3e5c1d97f02
+Create Date: 2026-10-18 15:12:09.447251
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd82c6a4f1e37'
+down_revision: Union[str, Sequence[str], None] = 'b3e5c1d97f02'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'register_outbox',
+        sa.Column('telegram_id', sa.BigInteger(), nullable=False),
+        sa.Column('requested_at', sa.DateTime(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.String(length=255), nullable=True),
+        sa.PrimaryKeyConstraint('telegram_id'),
+    )
+    op.create_index(
+        op.f('ix_register_outbox_next_attempt_at'), 'register_outbox', ['next_attempt_at']
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_register_outbox_next_attempt_at'), table_name='register_outbox')
+    op.drop_table('register_outbox')
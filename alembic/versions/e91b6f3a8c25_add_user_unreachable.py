@@ -0,0 +1,30 @@
+"""Add unreachable flag to users
+
+Revision ID: e91b6f3a8c25
+Revises: c47a9d05e1b3
+Create Date: 2026-10-18 12:31:54.118402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e91b6f3a8c25'
+down_revision: Union[str, Sequence[str], None] = 'c47a9d05e1b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('unreachable_at', sa.DateTime(), nullable=True))
+    op.add_column('users', sa.Column('unreachable_reason', sa.String(length=32), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'unreachable_reason')
+    op.drop_column('users', 'unreachable_at')
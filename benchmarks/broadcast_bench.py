@@ -0,0 +1,140 @@
+"""
+Бенчмарк рассылки против локальной заглушки Bot API (без сети и без БД).
+
+Сравнивает старый последовательный цикл (send + sleep(0.05)) с движком
+`src.services.broadcast.broadcast` и печатает сообщения в секунду.
+Дополнительно меряет CPU-стоимость подготовки запроса альбома на одного
+получателя: сборка InputMedia на каждого против готового шаблона.
+
+    python -m benchmarks.broadcast_bench --users 500 --latency 0.08
+    python -m benchmarks.broadcast_bench --flood-every 200   # с RetryAfter
+"""
+import argparse
+import asyncio
+import datetime as dt
+import json
+import time
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMediaGroup
+from aiogram.types import Chat, Message, InputMediaPhoto, MessageEntity
+
+from src.services.broadcast import broadcast, compile_payload
+
+
+class StubSession(BaseSession):
+    """
+    Сессия, которая «отвечает» как Telegram с заданной сетевой задержкой.
+    Каждый `flood_every`-й запрос получает RetryAfter на `flood_delay` секунд.
+    """
+
+    def __init__(self, latency: float, flood_every: int = 0, flood_delay: int = 1):
+        super().__init__()
+        self.latency = latency
+        self.flood_every = flood_every
+        self.flood_delay = flood_delay
+        self.requests = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        if self.flood_every and self.requests % self.flood_every == 0:
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=self.flood_delay)
+        return Message(
+            message_id=self.requests,
+            date=dt.datetime.now(),
+            chat=Chat(id=getattr(method, "chat_id", 0), type="private"),
+        )
+
+    async def stream_content(self, *args, **kwargs):
+        # бенчмарк ничего не скачивает: пустой асинхронный генератор
+        return
+        yield b""
+
+    async def close(self):
+        pass
+
+
+async def legacy_broadcast(bot: Bot, tg_ids, caption: str, throttle: float = 0.05) -> int:
+    # поведение до переписывания: по одному получателю и фиксированная пауза
+    sent = 0
+    for uid in tg_ids:
+        await bot.send_message(chat_id=uid, text=caption, parse_mode=None)
+        sent += 1
+        await asyncio.sleep(throttle)
+    return sent
+
+
+def payload_bench(recipients: int) -> None:
+    # form-data строит реальная aiohttp-сессия, но в сеть ничего не уходит
+    bot = Bot(token="42:BENCH", session=AiohttpSession())
+    files = [{"type": "photo", "file_id": f"file-{i}"} for i in range(5)]
+    entities = [{"type": "bold", "offset": 0, "length": 5}]
+
+    started = time.perf_counter()
+    for uid in range(recipients):
+        ent = [MessageEntity(**e) for e in entities]
+        media = [
+            InputMediaPhoto(media=f["file_id"], caption="bench" if i == 0 else None,
+                            caption_entities=ent if i == 0 else None, parse_mode=None)
+            for i, f in enumerate(files)
+        ]
+        bot.session.build_form_data(bot, SendMediaGroup(chat_id=uid, media=media))
+    legacy = time.perf_counter() - started
+
+    payload = compile_payload(
+        bot, caption="bench", caption_entities=json.dumps(entities), file_ids=json.dumps(files)
+    )
+    started = time.perf_counter()
+    for uid in range(recipients):
+        bot.session.build_form_data(bot, payload.for_chat(uid))
+    template = time.perf_counter() - started
+
+    print(
+        f"payload: per recipient {legacy / recipients * 1e6:.0f}us -> "
+        f"{template / recipients * 1e6:.0f}us (x{legacy / template:.1f})"
+    )
+
+
+async def run(args) -> None:
+    tg_ids = range(1, args.users + 1)
+
+    bot = Bot(token="42:BENCH", session=StubSession(args.latency))
+    started = time.perf_counter()
+    sent = await legacy_broadcast(bot, tg_ids, "bench")
+    legacy = time.perf_counter() - started
+    print(f"legacy : {sent} msgs in {legacy:.2f}s -> {sent / legacy:.1f} msg/s")
+
+    session = StubSession(args.latency, args.flood_every, args.flood_delay)
+    bot = Bot(token="42:BENCH", session=session)
+    started = time.perf_counter()
+    sent, failed = await broadcast(
+        bot, tg_ids, caption="bench", rate=args.rate, concurrency=args.concurrency
+    )
+    engine = time.perf_counter() - started
+    print(
+        f"engine : {sent} msgs ({failed} failed, {session.requests} requests) "
+        f"in {engine:.2f}s -> {sent / engine:.1f} msg/s"
+    )
+    print(f"speedup: x{legacy / engine:.1f}")
+
+    payload_bench(args.payload_recipients)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.08, help="задержка ответа заглушки, с")
+    parser.add_argument("--rate", type=float, default=25.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--flood-every", type=int, default=0, help="каждый N-й запрос получает RetryAfter")
+    parser.add_argument("--flood-delay", type=int, default=1)
+    parser.add_argument("--payload-recipients", type=int, default=5000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
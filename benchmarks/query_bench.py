@@ -0,0 +1,481 @@
+"""
+Бенчмарк запросов к базе: заполняет отдельную схему Postgres синтетическими
+таблицами (по умолчанию миллион пользователей, журнал рассылки по ним, пул
+ссылок, outbox, FSM, части альбомов) и печатает `EXPLAIN ANALYZE` по каждому
+запросу, который делают бот и webapp: время выполнения, узел плана,
+использованные индексы (включая арбитр ON CONFLICT) и прочитанные буферы.
+
+Запросы собираются теми же выражениями, что и в коде (AudienceFilter,
+reminder_due, COLUMNS экспорта, enqueue_register_stmt, PostgresStorage).
+Страничные и точечные запросы должны укладываться в --budget-ms, а в плане
+запроса должны быть ожидаемые индексы — иначе код выхода 1. С --compare
+каждый запрос дополнительно выполняется без индексов сегментации (DROP INDEX
+в откатываемой транзакции) — видно, что именно даёт индекс.
+
+    python -m benchmarks.query_bench
+    python -m benchmarks.query_bench --users 200000 --reseed --compare
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import statistics
+import sys
+from dataclasses import dataclass
+
+# настройки читаются при импорте — для бенчмарка хватает заглушек
+for name, value in {
+    "BOT_TOKEN": "42:BENCH",
+    "CHAT_ID": "-1",
+    "WEBAPP_URL": "https://example.com",
+}.items():
+    os.environ.setdefault(name, value)
+
+from aiogram.fsm.storage.base import StorageKey
+from psycopg2.extras import Json
+from sqlalchemy import create_engine, select, update, delete, func, text, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.pool import NullPool
+
+from src.config import settings
+from src.db import Base
+from src.models import (
+    User, BroadcastJob, BroadcastDelivery, InviteLink, RegisterOutbox, FsmState, MediaGroupPart,
+)
+from src.scheduler import reminder_due, SWEEP_BATCH
+from src.services import outbox
+from src.services.audience import AudienceFilter, PAGE_SIZE
+from src.services.broadcast_jobs import CLAIM_BATCH, FLUSH_BATCH
+from src.services.export import COLUMNS
+from src.services.fsm_storage import PostgresStorage, _key
+
+SCHEMA = "query_bench"
+# индексы, которые --compare убирает, чтобы показать план без них
+SEGMENT_INDEXES = (
+    "ix_users_specialization_reachable",
+    "ix_users_registered_at_reachable",
+    "ix_users_reminder_due",
+)
+SPECIALIZATIONS = (
+    "Терапевт", "Кардиолог", "Невролог", "Эндокринолог",
+    "Гастроэнтеролог", "Педиатр", "Хирург", "Другое",
+)
+FIRST_ID = 100_000_000
+TABLES = (User, BroadcastJob, BroadcastDelivery, InviteLink, RegisterOutbox, FsmState, MediaGroupPart)
+# кнопки специальностей в /broadcast (handlers.admin.MAX_SPECIALIZATION_BUTTONS)
+SPECIALIZATION_BUTTONS = 12
+INVITES = 10_000
+OUTBOX_ROWS = 100_000
+FSM_ROWS = 100_000
+MEDIA_GROUPS = 20_000
+PARTS_PER_GROUP = 5
+BENCH_BOT_ID = 42
+
+SEED_SQL = """
+INSERT INTO users (telegram_id, username, fio, specialization, email,
+                   invite_link, registered_at, unreachable_at, unreachable_reason, last_reminded_at)
+SELECT
+    -- telegram_id не совпадает с порядком регистрации, а строки в куче
+    -- лежат по registered_at — как в живой таблице, куда только добавляют
+    :first_id + (g::bigint * 7919) % :users,
+    'user' || g,
+    CASE WHEN r.filled THEN 'Пользователь ' || g END,
+    CASE WHEN r.filled THEN (:specs)[1 + (g % :n_specs)] END,
+    CASE WHEN r.filled THEN 'user' || g || '@example.com' END,
+    CASE WHEN r.filled THEN 'https://t.me/+bench' || g END,
+    r.registered_at,
+    CASE WHEN g % 20 = 0 THEN r.registered_at + interval '30 days' END,
+    CASE WHEN g % 20 = 0 THEN 'blocked' END,
+    CASE WHEN NOT r.filled AND g % 3 = 0 THEN r.registered_at + interval '5 days' END
+FROM generate_series(1, :users) AS g,
+LATERAL (
+    -- ссылка на g — чтобы random() считался для каждой строки
+    SELECT random() + g * 0 < 0.7 AS filled,
+           LOCALTIMESTAMP - (:users - g) * interval '730 days' / :users AS registered_at
+) AS r
+"""
+
+# остальные таблицы: выполняются после users, по порядку
+SEED_EXTRA_SQL = (
+    # завершённая рассылка по всем и идущая — дошла до середины
+    """
+    INSERT INTO broadcast_jobs (id, created_by, caption, status, last_telegram_id, sent, failed, created_at)
+    VALUES (1, 1, '', 'finished', 0, 0, 0, LOCALTIMESTAMP),
+           (2, 1, '', 'running', :first_id + :users / 2, 0, 0, LOCALTIMESTAMP)
+    """,
+    """
+    INSERT INTO broadcast_deliveries (job_id, telegram_id, status)
+    SELECT j, telegram_id, CASE WHEN j = 1 THEN 'sent' ELSE 'pending' END
+    FROM users, generate_series(1, 2) AS j
+    WHERE unreachable_at IS NULL AND (j = 1 OR telegram_id <= :first_id + :users / 2)
+    """,
+    """
+    INSERT INTO invite_links (link, created_at)
+    SELECT 'https://t.me/+pool' || g, LOCALTIMESTAMP FROM generate_series(1, :invites) AS g
+    """,
+    # очередь после сбоя Telegram: почти все попытки отложены, каждая сотая уже пора
+    """
+    INSERT INTO register_outbox (telegram_id, requested_at, next_attempt_at, attempts)
+    SELECT :first_id + g, LOCALTIMESTAMP,
+           LOCALTIMESTAMP + CASE WHEN g % 100 = 0 THEN interval '-1 minute' ELSE g * interval '1 second' END,
+           g % 5
+    FROM generate_series(1, :outbox_rows) AS g
+    """,
+    # ключ — как services.fsm_storage._key: bot:business:chat:thread:user:destiny
+    """
+    INSERT INTO fsm_states (key, state, data, updated_at)
+    SELECT :bot_id || '::' || (:first_id + g) || '::' || (:first_id + g) || ':' || :destiny,
+           CASE WHEN g % 2 = 0 THEN 'BroadcastStates:waiting_content' END,
+           jsonb_build_object('step', g % 3),
+           LOCALTIMESTAMP
+    FROM generate_series(1, :fsm_rows) AS g
+    """,
+    """
+    INSERT INTO media_group_parts (media_group_id, message_id, chat_id, user_id, file)
+    SELECT 'mg' || (g / :parts_per_group), g, 1, 1, jsonb_build_object('type', 'photo', 'file_id', 'f' || g)
+    FROM generate_series(0, :media_groups * :parts_per_group - 1) AS g
+    """,
+)
+
+
+@dataclass
+class Query:
+    name: str
+    stmt: object
+    # страничный/точечный запрос: время не должно зависеть от размера таблицы
+    budgeted: bool = True
+    # индексы, которые обязаны быть в плане (Index Name или арбитр ON CONFLICT)
+    expect: tuple[str, ...] = ()
+
+
+def queries(users: int) -> list[Query]:
+    now = dt.datetime.utcnow()
+    middle = FIRST_ID + users // 2
+    some_ids = [FIRST_ID + i for i in range(1, SWEEP_BATCH * 7, 7)]
+
+    def page(audience: AudienceFilter, after: int = 0):
+        return (
+            select(User.telegram_id)
+            .where(User.telegram_id > after, *audience.clauses())
+            .order_by(User.telegram_id)
+            .limit(PAGE_SIZE)
+        )
+
+    def count(audience: AudienceFilter):
+        return select(func.count()).select_from(User).where(User.telegram_id > 0, *audience.clauses())
+
+    one = AudienceFilter(specializations=SPECIALIZATIONS[:1])
+    two = AudienceFilter(specializations=SPECIALIZATIONS[1:3])
+    recent = AudienceFilter(registered_from=now - dt.timedelta(days=30))
+    recent_one = AudienceFilter(specializations=SPECIALIZATIONS[:1], registered_from=now - dt.timedelta(days=30))
+
+    spec_count = func.count().label("n")
+    fsm_key = StorageKey(bot_id=BENCH_BOT_ID, chat_id=FIRST_ID + FSM_ROWS // 2, user_id=FIRST_ID + FSM_ROWS // 2)
+    fsm_update = pg_insert(FsmState).values(key=_key(fsm_key), data={"step": 2}, updated_at=now)
+    media_group_id = f"mg{MEDIA_GROUPS // 2}"
+
+    return [
+        # services.audience: страницы рассылки и подсчёт аудитории
+        Query("audience page: all", page(AudienceFilter())),
+        Query("audience page: all, from middle", page(AudienceFilter(), after=middle)),
+        Query("audience page: 1 specialization", page(one)),
+        Query("audience page: 1 specialization, from middle", page(one, after=middle)),
+        Query("audience page: 2 specializations", page(two)),
+        Query("audience page: registered 30 days", page(recent)),
+        Query("audience page: 1 spec + 30 days", page(recent_one)),
+        Query("audience count: all", count(AudienceFilter()), budgeted=False),
+        Query("audience count: 1 specialization", count(one), budgeted=False),
+        Query("audience count: registered 30 days", count(recent)),
+        # scheduler.send_due_reminders
+        Query(
+            "reminders: due page",
+            select(User.telegram_id)
+            .where(User.telegram_id > 0, *reminder_due(now))
+            .order_by(User.telegram_id)
+            .limit(SWEEP_BATCH),
+        ),
+        Query(
+            "reminders: mark batch",
+            update(User).where(User.telegram_id.in_(some_ids)).values(last_reminded_at=now),
+        ),
+        # reachability.UnreachableMarker (EXPLAIN ANALYZE выполняет UPDATE — откатываем)
+        Query(
+            "unreachable: mark batch",
+            update(User)
+            .where(User.telegram_id.in_(some_ids))
+            .values(unreachable_at=now, unreachable_reason="blocked"),
+        ),
+        # webapp: index, /invite; бот: join_chat
+        Query(
+            "webapp: user by id",
+            select(User.fio, User.specialization, User.invite_link).where(User.telegram_id == middle),
+        ),
+        Query("webapp: invite by id", select(User.invite_link).where(User.telegram_id == middle)),
+        # handlers.admin: кнопки специальностей на каждый /broadcast. Агрегат по всем
+        # достижимым с анкетой (~70% таблицы): index-only scan по
+        # ix_users_specialization_reachable и seq scan стоят почти одинаково,
+        # планировщик вправе выбрать любой — индекс не требуем, время смотрим
+        Query(
+            "audience: specialization counts",
+            select(User.specialization, spec_count)
+            .where(User.specialization.is_not(None), User.unreachable_at.is_(None))
+            .group_by(User.specialization)
+            .order_by(spec_count.desc(), User.specialization)
+            .limit(SPECIALIZATION_BUTTONS),
+            budgeted=False,
+        ),
+        # handlers.start.upsert_user: повторный /start существующего пользователя
+        Query(
+            "/start: upsert user",
+            pg_insert(User)
+            .values(telegram_id=middle, username="bench", registered_at=now)
+            .on_conflict_do_update(
+                index_elements=[User.telegram_id],
+                set_={"registered_at": now, "unreachable_at": None, "unreachable_reason": None},
+            )
+            .returning(literal_column("xmax = 0")),
+            expect=("users_pkey",),
+        ),
+        # webapp /register: анкета и запрос в outbox в одной транзакции
+        Query(
+            "/register: upsert profile",
+            pg_insert(User)
+            # registered_at в коде ставит default модели — в скомпилированный запрос он не попадает
+            .values(telegram_id=middle, username="bench", fio="Бенч", specialization=SPECIALIZATIONS[0],
+                    email="bench@example.com", registered_at=now)
+            .on_conflict_do_update(
+                index_elements=[User.telegram_id],
+                set_={"fio": "Бенч", "specialization": SPECIALIZATIONS[0], "email": "bench@example.com"},
+            ),
+            expect=("users_pkey",),
+        ),
+        Query(
+            "/register: enqueue outbox",
+            outbox.enqueue_register_stmt(FIRST_ID + OUTBOX_ROWS // 2, now),
+            expect=("register_outbox_pkey",),
+        ),
+        # services.outbox._claim: due-записи по индексу next_attempt_at
+        Query(
+            "outbox: claim due",
+            update(RegisterOutbox)
+            .where(RegisterOutbox.telegram_id.in_(
+                select(RegisterOutbox.telegram_id)
+                .where(RegisterOutbox.next_attempt_at <= now)
+                .order_by(RegisterOutbox.next_attempt_at)
+                .limit(outbox.CLAIM_BATCH)
+                .with_for_update(skip_locked=True)
+                .scalar_subquery()
+            ))
+            .values(next_attempt_at=now + outbox.LEASE)
+            .returning(RegisterOutbox.telegram_id, RegisterOutbox.requested_at, RegisterOutbox.attempts),
+            expect=("ix_register_outbox_next_attempt_at",),
+        ),
+        # services.invite.checkout_invite
+        Query(
+            "invite: checkout",
+            delete(InviteLink)
+            .where(InviteLink.id == (
+                select(InviteLink.id)
+                .order_by(InviteLink.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+                .scalar_subquery()
+            ))
+            .returning(InviteLink.link),
+            expect=("invite_links_pkey",),
+        ),
+        # services.fsm_storage: каждый апдейт администратора
+        Query(
+            "fsm: get state",
+            select(FsmState.state).where(FsmState.key == _key(fsm_key)),
+            expect=("fsm_states_pkey",),
+        ),
+        Query(
+            "fsm: set state",
+            PostgresStorage()._upsert(fsm_key, {"state": "BroadcastStates:confirm"}),
+            expect=("fsm_states_pkey",),
+        ),
+        Query(
+            "fsm: update data",
+            fsm_update.on_conflict_do_update(
+                index_elements=[FsmState.key],
+                set_={"data": FsmState.data.concat(fsm_update.excluded.data), "updated_at": now},
+            ).returning(FsmState.data),
+            expect=("fsm_states_pkey",),
+        ),
+        # services.broadcast_jobs: страница получателей в журнал (в коде — executemany
+        # по одной строке; здесь страница одним VALUES) и запись итогов по PK.
+        # ON CONFLICT DO NOTHING без цели проверяет все уникальные индексы — у
+        # broadcast_deliveries это только PK, в плане арбитр не указывается
+        Query(
+            "broadcast: claim deliveries page",
+            pg_insert(BroadcastDelivery)
+            .values([
+                {"job_id": 2, "telegram_id": middle + i, "status": "pending"}
+                for i in range(1, CLAIM_BATCH + 1)
+            ])
+            .on_conflict_do_nothing(),
+        ),
+        Query(
+            "broadcast: record result",
+            update(BroadcastDelivery)
+            .where(BroadcastDelivery.job_id == 2, BroadcastDelivery.telegram_id == middle - 1)
+            .values(status="sent", error=None),
+            expect=("broadcast_deliveries_pkey",),
+        ),
+        Query(
+            "broadcast: flush counters",
+            update(BroadcastJob)
+            .where(BroadcastJob.id == 2)
+            .values(sent=BroadcastJob.sent + FLUSH_BATCH, failed=BroadcastJob.failed),
+        ),
+        # services.media_groups: тишина альбома и его сборка одним DELETE ... RETURNING
+        Query(
+            "media group: quiet for",
+            select(func.extract("epoch", func.localtimestamp() - func.max(MediaGroupPart.received_at)))
+            .where(MediaGroupPart.media_group_id == media_group_id),
+            expect=("media_group_parts_pkey",),
+        ),
+        Query(
+            "media group: flush",
+            delete(MediaGroupPart)
+            .where(MediaGroupPart.media_group_id == media_group_id)
+            .returning(
+                MediaGroupPart.message_id, MediaGroupPart.chat_id, MediaGroupPart.user_id,
+                MediaGroupPart.caption, MediaGroupPart.caption_entities, MediaGroupPart.file,
+            ),
+            expect=("media_group_parts_pkey",),
+        ),
+        # services.export — полный проход, бюджет не применяется
+        Query(
+            "export: all users",
+            select(*(column for _, column in COLUMNS)).order_by(User.telegram_id),
+            budgeted=False,
+        ),
+    ]
+
+
+def seed(conn: Connection, users: int) -> None:
+    conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+    conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    conn.execute(text(f"SET search_path TO {SCHEMA}"))
+    Base.metadata.create_all(conn, tables=[model.__table__ for model in TABLES])
+    params = {
+        "first_id": FIRST_ID, "users": users, "specs": list(SPECIALIZATIONS), "n_specs": len(SPECIALIZATIONS),
+        "invites": INVITES, "outbox_rows": OUTBOX_ROWS, "fsm_rows": FSM_ROWS, "bot_id": BENCH_BOT_ID, "destiny": "default",
+        "media_groups": MEDIA_GROUPS, "parts_per_group": PARTS_PER_GROUP,
+    }
+    for sql in (SEED_SQL, *SEED_EXTRA_SQL):
+        conn.execute(text(sql), params)
+
+
+def _walk(node: dict):
+    yield node
+    for child in node.get("Plans", ()):
+        yield from _walk(child)
+
+
+def explain(conn: Connection, query: Query, *, drop_indexes: bool = False) -> dict:
+    """Один EXPLAIN ANALYZE в откатываемой транзакции."""
+    compiled = query.stmt.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    # exec_driver_sql идёт мимо типов SQLAlchemy — JSONB-значения оборачиваем сами
+    params = {
+        name: Json(value) if isinstance(value, (dict, list)) else value
+        for name, value in compiled.params.items()
+    }
+    with conn.begin() as tx:
+        conn.execute(text(f"SET LOCAL search_path TO {SCHEMA}"))
+        if drop_indexes:
+            for index in SEGMENT_INDEXES:
+                conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+        raw = conn.exec_driver_sql(
+            f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {compiled}", params
+        ).scalar()
+        tx.rollback()
+
+    result = (json.loads(raw) if isinstance(raw, str) else raw)[0]
+    plan = result["Plan"]
+    nodes = list(_walk(plan))
+    indexes = sorted(
+        {node["Index Name"] for node in nodes if "Index Name" in node}
+        # INSERT ... ON CONFLICT ищет конфликт по индексу-арбитру
+        | {name for node in nodes for name in node.get("Conflict Arbiter Indexes", ())}
+    )
+    return {
+        "ms": result["Execution Time"],
+        "node": plan["Node Type"],
+        "scan": ", ".join(
+            dict.fromkeys(node["Node Type"] for node in nodes if "Scan" in node["Node Type"])
+        ),
+        "indexes": indexes,
+        "buffers": plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0),
+    }
+
+
+def measure(conn: Connection, query: Query, runs: int, **kwargs) -> tuple[float, dict]:
+    results = [explain(conn, query, **kwargs) for _ in range(runs)]
+    return statistics.median(r["ms"] for r in results), results[-1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=str(settings.database_url).replace("+asyncpg", "+psycopg2"))
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--reseed", action="store_true", help="пересоздать схему, даже если она уже заполнена")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=50, help="допустимая медиана страничных запросов, мс")
+    parser.add_argument("--compare", action="store_true", help="показать время без индексов сегментации")
+    args = parser.parse_args()
+
+    engine = create_engine(args.dsn, poolclass=NullPool, connect_args={"client_encoding": "utf8"})
+    with engine.connect() as conn:
+        with conn.begin():
+            existing = conn.execute(
+                text("SELECT count(*) FROM pg_tables WHERE schemaname = :schema AND tablename = ANY(:tables)"),
+                {"schema": SCHEMA, "tables": [model.__tablename__ for model in TABLES]},
+            ).scalar()
+            # схема от прежней версии бенчмарка (без части таблиц) пересоздаётся
+            rows = conn.execute(text(f"SELECT count(*) FROM {SCHEMA}.users")).scalar() if existing == len(TABLES) else 0
+        if args.reseed or rows != args.users:
+            print(f"seeding {args.users} users into schema {SCHEMA}…", flush=True)
+            with conn.begin():
+                seed(conn, args.users)
+            # карта видимости как у таблицы после autovacuum — иначе index-only scan ходит в кучу
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as vacuum:
+                for model in TABLES:
+                    vacuum.execute(text(f"VACUUM ANALYZE {SCHEMA}.{model.__tablename__}"))
+
+        failed, unindexed = [], []
+        header = f"{'query':<46} {'ms':>9}  {'buffers':>8}  plan"
+        if args.compare:
+            header = f"{'query':<46} {'ms':>9}  {'no idx':>9}  {'buffers':>8}  plan"
+        print(header)
+        for query in queries(args.users):
+            ms, plan = measure(conn, query, args.runs)
+            line = f"{query.name:<46} {ms:9.2f}  "
+            if args.compare:
+                without, _ = measure(conn, query, args.runs, drop_indexes=True)
+                line += f"{without:9.2f}  "
+            line += f"{plan['buffers']:8d}  {plan['node']}: {plan['scan']} [{', '.join(plan['indexes']) or '-'}]"
+            if query.budgeted and ms > args.budget_ms:
+                line += "  << over budget"
+                failed.append(query.name)
+            missing = [index for index in query.expect if index not in plan["indexes"]]
+            if missing:
+                line += f"  << index not used: {', '.join(missing)}"
+                unindexed.append(query.name)
+            print(line)
+    engine.dispose()
+
+    if failed:
+        print(f"FAIL: {len(failed)} queries exceed {args.budget_ms:.0f}ms: {', '.join(failed)}")
+    if unindexed:
+        print(f"FAIL: {len(unindexed)} queries miss their index: {', '.join(unindexed)}")
+    if failed or unindexed:
+        sys.exit(1)
+    print(f"OK: paged and point queries within {args.budget_ms:.0f}ms, expected indexes used")
+
+
+if __name__ == "__main__":
+    main()
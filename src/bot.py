@@ -1,45 +1,113 @@
 import asyncio
 import datetime as dt
+import logging
+from time import perf_counter
 
 from aiogram import Bot, Dispatcher
-from aiogram.client.bot import DefaultBotProperties
-from aiogram.enums.parse_mode import ParseMode
 
 # switch to absolute imports so that `__main__` can resolve them
 from src.config    import settings
 from src.handlers  import start, admin
 from src.db        import engine, Base
 # from src.import_users import import_users_from_excel
-from src.scheduler import setup_scheduler, reschedule_reminders_on_start
+from src.scheduler import setup_scheduler, pause_scheduler, resume_broadcasts
+from src.services.export import start_export_pool, shutdown_export_pool
+from src.services.fsm_storage import PostgresStorage
+from src.services.leader import AdvisoryLock, SCHEDULER_LEADER, run_as_leader, log_task_failure
+from src.services.telegram import get_bot, report_pool_stats
 
 
-async def main():
-    # await import_users_from_excel("tmp59q9jhov.xlsx")
-    # 1) Create Bot & Dispatcher
-    bot = Bot(
-        token=settings.bot_token,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
-    )
-    dp  = Dispatcher()
+def create_dispatcher(bot: Bot) -> Dispatcher:
+    """
+    Dispatcher со всеми роутерами и startup-хуком; общий для polling
+    и webhook-режима (см. src/webhook.py).
+    """
+    # FSM в Postgres: следующий апдейт администратора может попасть в другой процесс
+    dp  = Dispatcher(storage=PostgresStorage())
+    background: set[asyncio.Task] = set()
 
     # 2) on_startup: create tables AND start your scheduler
     async def on_startup():
+        started = perf_counter()
         # create tables (no Alembic, MVP)
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
 
-        # now hook up APScheduler → inside this call you must do scheduler.start()
-        setup_scheduler(bot)
-        await reschedule_reminders_on_start()
+        # планировщик (напоминания, пул ссылок, подхват брошенных рассылок)
+        # работает только в процессе-лидере, если запущено несколько копий бота
+        async def on_elected():
+            await setup_scheduler(bot)
+            # продолжаем рассылки, прерванные прошлым рестартом
+            await resume_broadcasts()
+
+        task = asyncio.create_task(run_as_leader(
+            "scheduler",
+            AdvisoryLock(SCHEDULER_LEADER, 0),
+            on_elected=on_elected,
+            on_demoted=pause_scheduler,
+        ), name="scheduler-leader")
+        background.add(task)
+        task.add_done_callback(background.discard)
+        task.add_done_callback(log_task_failure)
+
+        # альбомы рассылки, не собранные до рестарта (собирает ровно один процесс)
+        await admin.resume_media_groups(bot, dp.storage)
+
+        # процесс выгрузки поднимается в фоне, чтобы /export не ждал его запуска
+        task = asyncio.create_task(start_export_pool(), name="export-pool")
+        background.add(task)
+        task.add_done_callback(background.discard)
+        task.add_done_callback(log_task_failure)
+
+        # в webhook-режиме метрики пишет lifespan webapp, в котором работает dispatcher
+        if settings.bot_mode == "polling":
+            task = asyncio.create_task(report_pool_stats(), name="report-pool-stats")
+            background.add(task)
+            task.add_done_callback(background.discard)
+            task.add_done_callback(log_task_failure)
+
+        # метрика холодного старта: от startup до готовности к приёму апдейтов
+        logging.info(f"Startup completed in {perf_counter() - started:.3f}s")
 
     dp.startup.register(on_startup)
+    dp.shutdown.register(shutdown_export_pool)
 
     # 3) hook up your routers
     dp.include_router(start.router)
     dp.include_router(admin.router)
+    return dp
 
-    # 4) start long‑polling
+
+async def main():
+    # await import_users_from_excel("tmp59q9jhov.xlsx")
+    # 1) Create Bot & Dispatcher
+    # общий бот с пулом соединений (тот же, что у планировщика)
+    bot = get_bot()
+    dp = create_dispatcher(bot)
+
+    # 4) start long‑polling; webhook, если был, снимаем — иначе getUpdates не работает
+    await bot.delete_webhook()
     await dp.start_polling(bot)
 
+
+def serve_webhook():
+    """
+    Webhook-режим: апдейты принимает FastAPI-приложение webapp (роутер
+    src/webhook.py) в bot_workers процессах; Telegram распределяет запросы
+    между ними, а FSM, планировщик и рассылки согласуются через Postgres.
+    """
+    import uvicorn
+    uvicorn.run(
+        "src.webapp.main:app",
+        host=settings.webhook_host,
+        port=settings.webhook_port,
+        workers=settings.bot_workers,
+    )
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    if settings.bot_mode == "webhook":
+        serve_webhook()
+    else:
+        # getUpdates допускает только одного потребителя — один процесс
+        asyncio.run(main())
@@ -1,15 +1,74 @@
 # src/config.py
-from typing import List
-from pydantic import PostgresDsn
+from typing import List, Literal
+from pydantic import PostgresDsn, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     bot_token:    str
     database_url: PostgresDsn
+    # прямой адрес Postgres для LISTEN и advisory locks, если database_url смотрит в PgBouncer
+    database_direct_url: PostgresDsn | None = None
     chat_id:      int
     admin_ids:    List[int] = [429272623]
     webapp_url:   str
 
+    # лимит сообщений/с к Bot API на весь бот; делится поровну между
+    # процессами, которые шлют сообщения, и внутри процесса выдаётся
+    # по приоритетам (ответы пользователям > напоминания > рассылки)
+    telegram_rate:         float = 28.0
+    # сколько процессов шлют сообщения; None — bot_workers + 1 (webapp)
+    telegram_processes:    int | None = None
+    # рассылка: собственный темп и число параллельных отправок
+    # (быстрее доли процесса в telegram_rate рассылка всё равно не пойдёт)
+    broadcast_rate:        float = 25.0
+    broadcast_concurrency: int   = 8
+    # часовой пояс, в котором админ видит и вводит время отложенной рассылки (МСК)
+    broadcast_utc_offset:  int   = 3
+
+    # пул соединений SQLAlchemy к Postgres — свой в каждом процессе
+    # (бот, каждый воркер webapp): суммарно не больше max_connections сервера
+    db_pool_size:     int   = 5
+    db_max_overflow:  int   = 10      # сверх db_pool_size на пиках
+    db_pool_timeout:  float = 30.0    # сколько ждать свободного соединения, с
+    db_pool_recycle:  int   = 1800    # переоткрывать соединения старше, с (-1 — никогда)
+    db_pool_pre_ping: bool  = True    # проверять соединение перед выдачей
+    db_statement_cache_size: int = 100   # подготовленных выражений на соединение (0 — выкл.)
+    db_pgbouncer:     bool  = False   # совместимость с PgBouncer в режиме transaction
+
+    # пул соединений к Bot API, общий для бота, webapp и планировщика
+    telegram_pool_limit: int   = 32     # максимум одновременных соединений
+    telegram_keepalive:  float = 60.0   # сколько держать простаивающее соединение, с
+    telegram_timeout:    float = 30.0   # таймаут запроса, с
+
+    # пул заранее созданных ссылок-приглашений
+    invite_pool_size:        int   = 100   # до скольких ссылок пополняем
+    invite_pool_low_water:   int   = 30    # пополняем, когда осталось меньше
+    invite_pool_refill_rate: float = 1.0   # ссылок в секунду при пополнении
+
+    # кэш состояния пользователей в webapp
+    user_cache_size: int   = 10_000
+    user_cache_ttl:  float = 300.0   # с
+
+    # приём апдейтов: long polling или webhook (через FastAPI-приложение webapp)
+    bot_mode:       Literal["polling", "webhook"] = "polling"
+    webhook_url:    str | None = None    # публичный адрес, напр. https://bot.example.com
+    webhook_path:   str = "/telegram/webhook"
+    webhook_secret: str | None = None    # X-Telegram-Bot-Api-Secret-Token, обязателен в webhook-режиме
+    webhook_host:   str = "0.0.0.0"
+    webhook_port:   int = 8080
+    webhook_queue_size: int = 1000       # сколько апдейтов может ждать обработки
+    webhook_workers:    int = 16         # сколько апдейтов обрабатывается параллельно
+    bot_workers:        int = 1          # процессов в webhook-режиме (в polling всегда один)
+
+    @model_validator(mode="after")
+    def _check_webhook(self):
+        # без секрета кто угодно может прислать поддельный апдейт от имени админа
+        if self.bot_mode == "webhook":
+            missing = [name for name in ("webhook_url", "webhook_secret") if not getattr(self, name)]
+            if missing:
+                raise ValueError(f"bot_mode=webhook requires {', '.join(m.upper() for m in missing)}")
+        return self
+
     model_config = SettingsConfigDict(
         env_file = ".env",
         env_file_encoding = "utf-8",
@@ -1,8 +1,127 @@
+import logging
+import time
+import uuid
+from dataclasses import dataclass, asdict
+
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util.queue import AsyncAdaptedQueue, Empty
 from .config import settings
 
-engine = create_async_engine(str(settings.database_url), echo=False)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DbPoolStats:
+    """Счётчики пула соединений к Postgres в этом процессе."""
+    checkouts: int = 0          # выдано соединений из пула
+    waits: int = 0              # сколько раз пул был исчерпан и пришлось ждать
+    wait_seconds: float = 0     # суммарное время ожидания
+    max_wait_seconds: float = 0
+    timeouts: int = 0           # не дождались за db_pool_timeout
+    checked_out: int = 0        # занято прямо сейчас
+    overflow: int = 0           # открыто сверх db_pool_size
+    size: int = 0
+
+
+class _MeteredQueue(AsyncAdaptedQueue):
+    """Очередь свободных соединений пула; время блокирующего get — ожидание соединения."""
+
+    metrics: DbPoolStats
+
+    def get(self, block: bool = True, timeout: float | None = None):
+        # свободное соединение есть — берём сразу, без ожидания
+        try:
+            return self.get_nowait()
+        except Empty:
+            if not block:
+                raise
+        started = time.perf_counter()
+        try:
+            return super().get(block, timeout)
+        except Empty:
+            self.metrics.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.metrics.waits += 1
+            self.metrics.wait_seconds += waited
+            self.metrics.max_wait_seconds = max(self.metrics.max_wait_seconds, waited)
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """
+    AsyncAdaptedQueuePool, который считает выдачи соединений и ожидания
+    свободного соединения, когда пул и overflow исчерпаны.
+    """
+
+    _queue_class = _MeteredQueue
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = DbPoolStats(size=self.size())
+        self._pool.metrics = self.metrics
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = pool._pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        self.metrics.checkouts += 1
+        return super()._do_get()
+
+
+def _engine_options() -> dict:
+    options = dict(
+        echo=False,
+        poolclass=MeteredQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+    )
+    if settings.db_pgbouncer:
+        # PgBouncer в режиме transaction: соединение с сервером меняется между
+        # транзакциями, поэтому подготовленные выражения не кэшируем, а имена
+        # делаем уникальными — иначе «prepared statement already exists»
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    else:
+        options["connect_args"] = {
+            "prepared_statement_cache_size": settings.db_statement_cache_size,
+        }
+    return options
+
+
+engine = create_async_engine(str(settings.database_url), **_engine_options())
 async_session = async_sessionmaker(engine, expire_on_commit=False)
 
 Base = declarative_base()
+
+
+def asyncpg_dsn() -> str:
+    """
+    DSN для прямых соединений asyncpg (LISTEN, advisory locks) — без «+asyncpg».
+    Сессионные возможности не работают через PgBouncer в режиме transaction,
+    поэтому при db_pgbouncer нужен database_direct_url мимо него.
+    """
+    url = settings.database_direct_url or settings.database_url
+    return str(url).replace("+asyncpg", "")
+
+
+def db_pool_stats() -> DbPoolStats:
+    pool = engine.pool
+    metrics = pool.metrics
+    metrics.checked_out = pool.checkedout()
+    metrics.overflow = max(pool.overflow(), 0)
+    return metrics
+
+
+def log_db_pool_stats() -> None:
+    logger.info("Database pool: %s", asdict(db_pool_stats()))
@@ -1,21 +1,26 @@
-import asyncio
+import html
 import json
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from functools import partial
 
-from aiogram import Router, F, types
-from aiogram.exceptions import TelegramAPIError
-from aiogram.filters import StateFilter, Command
+from aiogram import Bot, Router, F, types
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
+from aiogram.filters import StateFilter, Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
 from aiogram.types import Message, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-from sqlalchemy import select
 
 from ..config import settings
-from ..services.broadcast import broadcast
-from ..db import async_session
-from ..models import User
-import pandas as pd
+from ..services.audience import AudienceFilter, count_recipients, specialization_counts
+from ..services.broadcast_jobs import create_job, start_job, cancel_job
+from ..services.broadcast_progress import stop_keyboard, format_eta
+from ..services.export import export_users, FORMATS
+from ..services.media_groups import MediaGroup, add_part, schedule_flush, pending_groups
+from ..services.telegram import outbound_rate
+from ..scheduler import schedule_broadcast, unschedule_broadcast
+import os
 import tempfile
 
 # ---------------------------------------------------------------------------
@@ -37,7 +42,75 @@ def is_admin(msg: types.Message) -> bool:
 
 
 class BroadcastStates(StatesGroup):
+    choosing_audience = State()
     waiting_for_message = State()
+    scheduling = State()
+
+
+# кнопки периода регистрации: дней назад (0 — за всё время)
+REGISTERED_WINDOWS = (0, 7, 30, 90, 365)
+# сколько специальностей показывать кнопками (самые многочисленные)
+MAX_SPECIALIZATION_BUTTONS = 12
+
+CANCEL_BUTTON = InlineKeyboardButton(text="❌ Отмена", callback_data="broadcast_cancel")
+
+
+def _audience(data: dict) -> AudienceFilter:
+    """Фильтр аудитории из выбора администратора в FSM."""
+    days = data.get("days") or 0
+    return AudienceFilter(
+        specializations=tuple(data.get("specs") or ()),
+        registered_from=datetime.utcnow() - timedelta(days=days) if days else None,
+        completed_only=bool(data.get("completed_only")),
+    )
+
+
+def _audience_keyboard(data: dict) -> InlineKeyboardMarkup:
+    selected = set(data.get("specs") or ())
+    rows = []
+    options = data.get("spec_options") or []
+    for i in range(0, len(options), 2):
+        rows.append([
+            InlineKeyboardButton(
+                text=f"{'✅ ' if name in selected else ''}{name} ({count})",
+                callback_data=f"broadcast_aud:spec:{i + j}",
+            )
+            for j, (name, count) in enumerate(options[i:i + 2])
+        ])
+    days = data.get("days") or 0
+    rows.append([
+        InlineKeyboardButton(
+            text=f"{'• ' if value == days else ''}{f'{value} дн.' if value else 'Всё время'}",
+            callback_data=f"broadcast_aud:days:{value}",
+        )
+        for value in REGISTERED_WINDOWS
+    ])
+    rows.append([
+        InlineKeyboardButton(
+            text=f"{'✅' if data.get('completed_only') else '⬜️'} Только заполнившие анкету",
+            callback_data="broadcast_aud:completed",
+        )
+    ])
+    rows.append([
+        InlineKeyboardButton(text="Сбросить", callback_data="broadcast_aud:reset"),
+        InlineKeyboardButton(text="Далее ➡️", callback_data="broadcast_aud:next"),
+    ])
+    rows.append([CANCEL_BUTTON])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+async def _audience_text(data: dict) -> str:
+    audience = _audience(data)
+    # предпросмотр — один COUNT по тем же условиям, что и рассылка
+    total = await count_recipients(audience)
+    lines = ["Кому отправить рассылку?", ""]
+    lines.append("Специальности: " + (html.escape(", ".join(audience.specializations)) or "все"))
+    days = data.get("days") or 0
+    lines.append(f"Зарегистрированы: {f'за последние {days} дн.' if days else 'за всё время'}")
+    if audience.completed_only:
+        lines.append("Только заполнившие анкету")
+    lines += ["", f"Получателей: <b>{total}</b>"]
+    return "\n".join(lines)
 
 
 @router.message(Command("broadcast"))
@@ -48,11 +121,51 @@ async def start_broadcast(msg: types.Message, state: FSMContext):
 
     logger.info("Admin %s started a broadcast session", msg.from_user.id)
     await state.clear()
-    kb = InlineKeyboardMarkup(
-        inline_keyboard=[[InlineKeyboardButton(text="❌ Отмена", callback_data="broadcast_cancel")]]
-    )
-    await msg.answer("Пришлите сообщение (с медиа или без) для рассылки.", reply_markup=kb)
-    await state.set_state(BroadcastStates.waiting_for_message)
+    data = {"spec_options": await specialization_counts(MAX_SPECIALIZATION_BUTTONS)}
+    await state.set_state(BroadcastStates.choosing_audience)
+    await state.set_data(data)
+    await msg.answer(await _audience_text(data), reply_markup=_audience_keyboard(data))
+
+
+@router.callback_query(BroadcastStates.choosing_audience, F.data.startswith("broadcast_aud:"))
+async def choose_audience(cb: types.CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    action, _, value = cb.data.removeprefix("broadcast_aud:").partition(":")
+
+    if action == "spec":
+        name = data["spec_options"][int(value)][0]
+        specs = data.get("specs") or []
+        data["specs"] = [s for s in specs if s != name] if name in specs else specs + [name]
+    elif action == "days":
+        data["days"] = int(value)
+    elif action == "completed":
+        data["completed_only"] = not data.get("completed_only")
+    elif action == "reset":
+        data = {"spec_options": data.get("spec_options") or []}
+    elif action == "next":
+        audience = _audience(data)
+        total = await count_recipients(audience)
+        if not total:
+            await cb.answer("Под выбранные условия никто не подходит.", show_alert=True)
+            return
+        # период фиксируем сейчас: рассылка уйдёт тем, кого админ видел в предпросмотре
+        await state.update_data(audience=audience.to_json())
+        await state.set_state(BroadcastStates.waiting_for_message)
+        logger.info("Admin %s selected broadcast audience of %d users", cb.from_user.id, total)
+        await cb.message.edit_text(
+            f"Получателей: <b>{total}</b>.\nПришлите сообщение (с медиа или без) для рассылки.",
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[[CANCEL_BUTTON]]),
+        )
+        await cb.answer()
+        return
+
+    await state.set_data(data)
+    try:
+        await cb.message.edit_text(await _audience_text(data), reply_markup=_audience_keyboard(data))
+    except TelegramBadRequest:
+        # «message is not modified» — выбор не изменился
+        pass
+    await cb.answer()
 
 
 @router.callback_query(F.data == "broadcast_cancel")
@@ -70,29 +183,26 @@ async def collect_broadcast_content(msg: types.Message, state: FSMContext):
 
     if msg.media_group_id:
         logger.debug("Message is part of media group %s", msg.media_group_id)
-        data = await state.get_data()
-        media_group = data.get("media_group", [])
-        media_group.append(msg)
-        await state.update_data(media_group=media_group)
-        if len(media_group) == 1:
-            asyncio.create_task(process_media_group_later(msg.media_group_id, state, msg))
+        # части альбома приходят отдельными апдейтами, возможно в разные процессы:
+        # копим их в Postgres и собираем, когда новые части перестают приходить
+        await add_part(
+            msg.media_group_id,
+            message_id=msg.message_id,
+            chat_id=msg.chat.id,
+            user_id=msg.from_user.id,
+            caption=msg.caption,
+            caption_entities=_entities(msg.caption_entities),
+            file=_attachment(msg),
+        )
+        schedule_flush(msg.media_group_id, partial(media_group_collected, msg.bot, state.storage))
         return
 
     file_list = []
     caption = msg.caption or msg.text or ""
-    if msg.caption_entities:
-        caption_entities = [ent.model_dump() for ent in msg.caption_entities]
-    elif msg.entities:
-        caption_entities = [ent.model_dump() for ent in msg.entities]
-    else:
-        caption_entities = None
+    caption_entities = _entities(msg.caption_entities) or _entities(msg.entities)
 
-    if msg.photo:
-        file_list.append({"type": "photo", "file_id": msg.photo[-1].file_id})
-    elif msg.document:
-        file_list.append({"type": "document", "file_id": msg.document.file_id})
-    elif msg.video:
-        file_list.append({"type": "video", "file_id": msg.video.file_id})
+    if attachment := _attachment(msg):
+        file_list.append(attachment)
 
     logger.info(
         "Preparing to broadcast message from admin %s with %d attachments",
@@ -100,103 +210,311 @@ async def collect_broadcast_content(msg: types.Message, state: FSMContext):
         len(file_list),
     )
 
-    # Получаем список пользователей
-    async with async_session() as sess:
-        result = await sess.execute(select(User.telegram_id))
-        tg_ids = result.scalars().all()
-    logger.debug("Fetched %d user ids for broadcast", len(tg_ids))
+    content = {"caption": caption, "caption_entities": caption_entities, "files": file_list}
+    await offer_schedule(msg.bot, state, msg.chat.id, content)
 
-    sent, failed = await broadcast(
-        bot=msg.bot,
-        tg_ids=tg_ids,
-        caption=caption,
-        caption_entities=json.dumps(caption_entities) if caption_entities else None,
-        file_ids=json.dumps(file_list) if file_list else None,
-    )
 
-    logger.info("Broadcast completed by admin %s: sent=%s, failed=%s", msg.from_user.id, sent, failed)
-    await msg.answer(f"Рассылка завершена.\n✅ Отправлено: {sent}\n❌ Ошибок: {failed}")
-    await state.clear()
+def _entities(entities: list[types.MessageEntity] | None) -> list[dict] | None:
+    if not entities:
+        return None
+    return [ent.model_dump(mode="json", exclude_none=True) for ent in entities]
+
+
+def _attachment(msg: types.Message) -> dict | None:
+    if msg.photo:
+        return {"type": "photo", "file_id": msg.photo[-1].file_id}
+    if msg.document:
+        return {"type": "document", "file_id": msg.document.file_id}
+    if msg.video:
+        return {"type": "video", "file_id": msg.video.file_id}
+    return None
 
 
-async def process_media_group_later(group_id: str, state: FSMContext, msg: types.Message):
+async def media_group_collected(bot: Bot, storage: BaseStorage, group: MediaGroup):
     """
-    Асинхронная обработка всей media-группы.
+    Альбом собран: переходим к выбору времени отправки. FSM-состояние берём
+    из общего хранилища, а не из апдейта — альбом может собираться и после
+    рестарта процесса.
     """
-    logger.debug("Starting delayed processing for media group %s", group_id)
-    await asyncio.sleep(1)  # Ждём, пока все части дойдут
+    key = StorageKey(bot_id=bot.id, chat_id=group.chat_id, user_id=group.user_id)
+    state = FSMContext(storage=storage, key=key)
+    if await state.get_state() != BroadcastStates.waiting_for_message.state:
+        logger.info("Media group %s arrived after the broadcast was cancelled", group.media_group_id)
+        return
+    content = {"caption": group.caption, "caption_entities": group.caption_entities, "files": group.files}
+    await offer_schedule(bot, state, group.chat_id, content)
+
+
+async def resume_media_groups(bot: Bot, storage: BaseStorage):
+    """Дособирает альбомы, части которых пришли до рестарта."""
+    for group_id in await pending_groups():
+        schedule_flush(group_id, partial(media_group_collected, bot, storage))
+
+
+# когда отправить: ключ -> подпись (время считается в момент нажатия)
+SEND_AT_OPTIONS = {"now": "Сейчас", "1h": "Через 1 ч", "3h": "Через 3 ч", "tomorrow": "Завтра 10:00"}
+# окно доставки, с (0 — как можно быстрее)
+WINDOW_OPTIONS = {0: "Сразу", 3600: "1 ч", 3 * 3600: "3 ч", 6 * 3600: "6 ч"}
+# потолок скорости рассылки, сообщ./с (0 — общий лимит broadcast_rate)
+RATE_OPTIONS = {0: "Макс.", 10: "10/с", 5: "5/с", 1: "1/с"}
+
+
+def _local_tz() -> timezone:
+    return timezone(timedelta(hours=settings.broadcast_utc_offset))
+
+
+def _format_local(moment: datetime) -> str:
+    """UTC (naive, как в моделях) -> время админа."""
+    local = moment.replace(tzinfo=timezone.utc).astimezone(_local_tz())
+    return f"{local:%d.%m.%Y %H:%M} (UTC{settings.broadcast_utc_offset:+d})"
+
+
+def _send_at(option: str) -> datetime | None:
+    now = datetime.utcnow()
+    if option == "1h":
+        return now + timedelta(hours=1)
+    if option == "3h":
+        return now + timedelta(hours=3)
+    if option == "tomorrow":
+        local = datetime.now(_local_tz()) + timedelta(days=1)
+        local = local.replace(hour=10, minute=0, second=0, microsecond=0)
+        return local.astimezone(timezone.utc).replace(tzinfo=None)
+    return None
+
+
+def _parse_send_at(text: str) -> datetime | None:
+    """«ДД.ММ ЧЧ:ММ» или «ДД.ММ.ГГГГ ЧЧ:ММ» во времени админа -> UTC."""
+    tz = _local_tz()
+    now = datetime.now(tz)
+    day, _, time_ = " ".join(text.split()).partition(" ")
+    if day.count(".") == 1:
+        # без года — ближайшая такая дата начиная с сегодняшней; год подставляем
+        # до strptime, иначе он берёт 1900 и не разбирает 29.02. Сегодняшняя дата
+        # с прошедшим временем остаётся в прошлом — вызывающий сообщит об этом
+        candidates = [f"{day}.{year} {time_}" for year in range(now.year, now.year + 5)]
+    else:
+        candidates = [f"{day} {time_}"]
+    for candidate in candidates:
+        try:
+            local = datetime.strptime(candidate, "%d.%m.%Y %H:%M").replace(tzinfo=tz)
+        except ValueError:
+            continue
+        if len(candidates) > 1 and local.date() < now.date():
+            continue
+        return local.astimezone(timezone.utc).replace(tzinfo=None)
+    return None
+
+
+def _schedule_keyboard(data: dict) -> InlineKeyboardMarkup:
+    def row(prefix: str, options: dict, selected) -> list[InlineKeyboardButton]:
+        return [
+            InlineKeyboardButton(
+                text=f"{'• ' if key == selected else ''}{label}",
+                callback_data=f"broadcast_when:{prefix}:{key}",
+            )
+            for key, label in options.items()
+        ]
+
+    go = "✅ Запланировать" if data.get("send_at") else "✅ Отправить"
+    return InlineKeyboardMarkup(inline_keyboard=[
+        row("at", SEND_AT_OPTIONS, data.get("when", "now")),
+        row("window", WINDOW_OPTIONS, data.get("window", 0)),
+        row("rate", RATE_OPTIONS, data.get("max_rate", 0)),
+        [InlineKeyboardButton(text=go, callback_data="broadcast_when:go")],
+        [CANCEL_BUTTON],
+    ])
+
+
+async def _schedule_text(data: dict) -> str:
+    total = await count_recipients(AudienceFilter.from_json(data.get("audience")))
+    send_at = datetime.fromisoformat(data["send_at"]) if data.get("send_at") else None
+    window = data.get("window", 0)
+    max_rate = data.get("max_rate", 0)
+
+    # оценка длительности — тем же расчётом темпа, что и у задания;
+    # быстрее доли процесса в общем бюджете Telegram рассылка не пойдёт
+    rates = [min(settings.broadcast_rate, outbound_rate())]
+    if max_rate:
+        rates.append(max_rate)
+    if window:
+        rates.append(max(total / window, 1 / 60))
+    duration = total / min(rates)
+
+    lines = [
+        f"Получателей: <b>{total}</b>",
+        f"Отправка: {_format_local(send_at) if send_at else 'сейчас'}",
+        f"Окно доставки: {format_eta(window) if window else 'нет'}",
+        f"Скорость: {f'не больше {max_rate} сообщ./с' if max_rate else 'максимальная'}",
+        f"Займёт ≈ {format_eta(duration)}",
+        "",
+        "Своё время можно прислать сообщением: ДД.ММ ЧЧ:ММ или ДД.ММ.ГГГГ ЧЧ:ММ "
+        f"(UTC{settings.broadcast_utc_offset:+d}).",
+    ]
+    return "\n".join(lines)
+
+
+async def offer_schedule(bot: Bot, state: FSMContext, chat_id: int, content: dict):
+    """Контент получен — спрашиваем, когда и с какой скоростью отправлять."""
+    await state.update_data(content=content, when="now", send_at=None, window=0, max_rate=0)
+    await state.set_state(BroadcastStates.scheduling)
     data = await state.get_data()
-    messages = data.get("media_group", [])
-    messages = sorted(messages, key=lambda m: m.message_id)
-    logger.debug("Collected %d messages in media group %s", len(messages), group_id)
+    await bot.send_message(chat_id, await _schedule_text(data), reply_markup=_schedule_keyboard(data))
 
-    file_list = []
-    caption = messages[0].caption or ""
-    if messages[0].caption_entities:
-        caption_entities = [e.model_dump() for e in messages[0].caption_entities]
+
+@router.callback_query(BroadcastStates.scheduling, F.data.startswith("broadcast_when:"))
+async def choose_schedule(cb: types.CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    action, _, value = cb.data.removeprefix("broadcast_when:").partition(":")
+
+    if action == "go":
+        await state.clear()
+        await cb.message.edit_reply_markup(reply_markup=None)
+        await cb.answer()
+        content = data["content"]
+        send_at = datetime.fromisoformat(data["send_at"]) if data.get("send_at") else None
+        await launch_broadcast(
+            cb.bot, cb.message.chat.id, cb.from_user.id,
+            content["caption"], content["caption_entities"], content["files"],
+            audience=AudienceFilter.from_json(data.get("audience")),
+            scheduled_at=send_at,
+            window_seconds=data.get("window") or None,
+            max_rate=data.get("max_rate") or None,
+        )
+        return
+
+    if action == "at":
+        send_at = _send_at(value)
+        data.update(when=value, send_at=send_at.isoformat() if send_at else None)
+    elif action == "window":
+        data["window"] = int(value)
+    elif action == "rate":
+        data["max_rate"] = int(value)
+    await state.set_data(data)
+    try:
+        await cb.message.edit_text(await _schedule_text(data), reply_markup=_schedule_keyboard(data))
+    except TelegramBadRequest:
+        # «message is not modified» — выбор не изменился
+        pass
+    await cb.answer()
+
+
+@router.message(BroadcastStates.scheduling, F.text)
+async def custom_send_at(msg: types.Message, state: FSMContext):
+    send_at = _parse_send_at(msg.text)
+    if send_at is None:
+        await msg.answer("Не понял время. Пример: 25.12 10:00 или 25.12.2026 10:00.")
+        return
+    if send_at <= datetime.utcnow():
+        await msg.answer("Это время уже прошло.")
+        return
+    data = await state.update_data(when="custom", send_at=send_at.isoformat())
+    await msg.answer(await _schedule_text(data), reply_markup=_schedule_keyboard(data))
+
+
+async def launch_broadcast(
+    bot: Bot, chat_id: int, admin_id: int, caption: str, caption_entities: list | None, file_list: list,
+    *,
+    audience: AudienceFilter | None = None,
+    scheduled_at: datetime | None = None,
+    window_seconds: int | None = None,
+    max_rate: float | None = None,
+):
+    """
+    Сохраняет рассылку как задание (для выбранной аудитории) и запускает её
+    в фоне или ставит в планировщик на scheduled_at (UTC).
+    Ход рассылки отображается в отдельном сообщении с кнопкой остановки,
+    а FSM-состояние администратора освобождается сразу.
+    """
+    scheduled = scheduled_at is not None and scheduled_at > datetime.utcnow()
+    if scheduled:
+        progress = await bot.send_message(chat_id, f"🗓 Рассылка запланирована на {_format_local(scheduled_at)}")
     else:
-        caption_entities = None
-
-    for m in messages:
-        if m.photo:
-            file_list.append({"type": "photo", "file_id": m.photo[-1].file_id})
-        elif m.document:
-            file_list.append({"type": "document", "file_id": m.document.file_id})
-        elif m.video:
-            file_list.append({"type": "video", "file_id": m.video.file_id})
-
-    # Получаем список пользователей
-    async with async_session() as sess:
-        result = await sess.execute(select(User.telegram_id))
-        tg_ids = result.scalars().all()
-    logger.debug("Fetched %d user ids for media group broadcast", len(tg_ids))
-
-    sent, failed = await broadcast(
-        bot=msg.bot,
-        tg_ids=tg_ids,
+        scheduled_at = None
+        progress = await bot.send_message(chat_id, "📨 Рассылка запускается…")
+    # Сохраняем рассылку как задание — после рестарта она продолжится с места остановки
+    job_id = await create_job(
+        admin_id,
         caption=caption,
         caption_entities=json.dumps(caption_entities) if caption_entities else None,
-        file_ids=json.dumps(file_list),
+        file_ids=json.dumps(file_list) if file_list else None,
+        audience=audience,
+        status="scheduled" if scheduled else "running",
+        scheduled_at=scheduled_at,
+        window_seconds=window_seconds,
+        max_rate=max_rate,
+        progress_chat_id=progress.chat.id,
+        progress_message_id=progress.message_id,
     )
+    if scheduled:
+        await schedule_broadcast(job_id, scheduled_at)
+        # до запуска сообщение позволяет отменить рассылку; дальше его ведёт ProgressReporter
+        await bot.edit_message_reply_markup(
+            chat_id=progress.chat.id, message_id=progress.message_id, reply_markup=stop_keyboard(job_id)
+        )
+        logger.info("Broadcast job #%s scheduled by admin %s at %s UTC", job_id, admin_id, scheduled_at)
+        return
 
-    logger.info("Media group broadcast completed: sent=%s, failed=%s", sent, failed)
-    await msg.answer(f"Рассылка завершена.\n✅ Отправлено: {sent}\n❌ Ошибок: {failed}")
-    await state.clear()
+    start_job(
+        bot,
+        job_id,
+        rate=settings.broadcast_rate,
+        concurrency=settings.broadcast_concurrency,
+    )
+    logger.info(
+        "Broadcast job #%s started by admin %s with %d attachments",
+        job_id,
+        admin_id,
+        len(file_list),
+    )
 
 
-@router.message(F.text == "/export")
-async def cmd_export(msg: Message):
+@router.callback_query(F.data.startswith("broadcast_stop:"))
+async def stop_broadcast(cb: types.CallbackQuery):
+    if cb.from_user.id not in settings.admin_ids:
+        logger.warning("User %s attempted to stop broadcast without permissions", cb.from_user.id)
+        await cb.answer()
+        return
+
+    job_id = int(cb.data.split(":", 1)[1])
+    previous = await cancel_job(job_id)
+    if previous == "scheduled":
+        # отложенная рассылка не запускалась — сообщение о прогрессе никто не ведёт
+        logger.info("Scheduled broadcast job #%s cancelled by admin %s", job_id, cb.from_user.id)
+        await unschedule_broadcast(job_id)
+        await cb.message.edit_text(f"Отложенная рассылка #{job_id} отменена.")
+        await cb.answer()
+    elif previous:
+        logger.info("Broadcast job #%s stopped by admin %s", job_id, cb.from_user.id)
+        await cb.answer("Останавливаю рассылку…")
+    else:
+        await cb.answer("Рассылка уже не выполняется.")
+        await cb.message.edit_reply_markup(reply_markup=None)
+
+
+@router.message(Command("export"))
+async def cmd_export(msg: Message, command: CommandObject):
     if not is_admin(msg):
         return
 
-    logger.info("Admin %s requested user export", msg.from_user.id)
-    async with async_session() as sess:
-        result = await sess.execute(select(User))
-        users = result.scalars().all()
-
-    logger.debug("Exporting %d users to Excel", len(users))
-    # Преобразуем список ORM-объектов в список словарей
-    data = [
-        {
-            "ID Telegram": u.telegram_id,
-            "Имя пользователя": u.username,
-            "ФИО": u.fio,
-            "Специализация": u.specialization,
-            "Email": u.email,
-            "Дата регистрации (UTC)": u.registered_at,
-        }
-        for u in users
-    ]
+    # /export — Excel, /export csv — CSV в gzip
+    fmt = (command.args or "xlsx").strip().lower()
+    if fmt not in FORMATS:
+        await msg.answer("Формат не поддерживается. Используйте /export или /export csv.")
+        return
 
-    df = pd.DataFrame(data)
+    logger.info("Admin %s requested user export (%s)", msg.from_user.id, fmt)
     timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    filename = f"users_{timestamp}.xlsx"
-    with tempfile.NamedTemporaryFile("wb", suffix=".xlsx", delete=False) as fp:
-        df.to_excel(fp.name, index=False)
+    filename = f"users_{timestamp}{FORMATS[fmt]}"
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, filename)
+        total = await export_users(path, fmt)
         await msg.answer_document(
-            FSInputFile(fp.name),
+            FSInputFile(path),
             filename=filename,
-            caption=f"Отчёт сформирован: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC",
+            caption=(
+                f"Отчёт сформирован: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC\n"
+                f"Пользователей: {total}"
+            ),
         )
     logger.info("User export sent to admin %s", msg.from_user.id)
 
@@ -214,6 +532,7 @@ async def cmd_info(msg: Message):
         "<b>Доступные команды:</b>\n"
         "/broadcast — запустить рассылку. После команды пришлите текст или медиа.\n"
         "/export — экспорт списка пользователей в Excel.\n"
+        "/export csv — то же в CSV (gzip), быстрее для больших выгрузок.\n"
     )
     await msg.answer(text, parse_mode="HTML")
     logger.info("Sent command list to admin %s", msg.from_user.id)
@@ -1,16 +1,16 @@
+import asyncio
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from aiogram import Router, F
-from aiogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
-from apscheduler.triggers.interval import IntervalTrigger
-from sqlalchemy import update, select
-from sqlalchemy.exc import IntegrityError
+from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
+from sqlalchemy import update, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from ..config import settings
-from ..services.invite import create_one_time_invite
+from ..services.invite import checkout_invite
+from ..services.user_cache import notify_user_changed
 from ..db import async_session
 from ..models import User
-from ..scheduler import scheduler, cleanup_unregistered  # see next section
 
 router = Router()
 
@@ -35,63 +35,86 @@ GIFT_TEXT = (
     "💬 Больше полезных материалов тебя ждёт в нашем чате — оставайся с нами!"
 )
 
+JOIN_CALLBACK = "join_chat"
+
+
+def webapp_keyboard(uid: int) -> InlineKeyboardMarkup:
+    button = InlineKeyboardButton(
+        text="Подключиться к чату",
+        web_app=WebAppInfo(url=f"{settings.webapp_url}/?uid={uid}")
+    )
+    return InlineKeyboardMarkup(inline_keyboard=[[button]])
+
+
+async def upsert_user(telegram_id: int, username: str | None) -> bool:
+    """
+    Регистрирует пользователя или обновляет registered_at у существующего
+    одним INSERT ... ON CONFLICT. Возвращает True, если пользователь новый.
+    """
+    now = datetime.utcnow()
+    stmt = pg_insert(User).values(
+        telegram_id=telegram_id,
+        username=username,
+        registered_at=now,
+        # fio/specialization/email/invite_link — оставляем None
+    ).on_conflict_do_update(
+        index_elements=[User.telegram_id],
+        set_={
+            "registered_at": now,
+            # снова пишет боту — возвращаем в рассылки и напоминания
+            "unreachable_at": None,
+            "unreachable_reason": None,
+        },
+    # xmax = 0 только у строки, которую вставили, а не обновили
+    ).returning(literal_column("xmax = 0"))
+
+    async with async_session() as sess:
+        inserted = (await sess.execute(stmt)).scalar_one()
+        # сбрасываем кэш состояния пользователя в webapp
+        await sess.execute(notify_user_changed(telegram_id))
+        await sess.commit()
+    return inserted
+
+
 @router.message(F.text == "/start")
 async def cmd_start(msg: Message):
-    await msg.answer(WELCOME_TEXT)
+    # приветствие и запись в БД идут параллельно: в Telegram за это время
+    # уходит только одно сообщение
+    welcome = asyncio.ensure_future(msg.answer(WELCOME_TEXT))
+    inserted = await upsert_user(msg.from_user.id, msg.from_user.username)
+    await welcome
+
+    if inserted:
+        # Новым пользователям — кнопка вступления; ссылку создаём при нажатии
+        button = InlineKeyboardButton(text="Подключиться к чату", callback_data=JOIN_CALLBACK)
+        kb = InlineKeyboardMarkup(inline_keyboard=[[button]])
+        # напоминание о специальности отправит периодическая проверка в scheduler
+    else:
+        # Для уже зареганного пользователя отправляем только кнопку WebApp
+        kb = webapp_keyboard(msg.from_user.id)
+
+    await msg.answer(GIFT_TEXT, reply_markup=kb)
+
 
-    # 1) Создаём новую одноразовую ссылку
-    invite_link = await create_one_time_invite(msg.bot)
+@router.callback_query(F.data == JOIN_CALLBACK)
+async def join_chat(cb: CallbackQuery):
+    """
+    Ссылка-приглашение создаётся только когда пользователь действительно
+    решил вступить; кнопка заменяется на прямую ссылку.
+    """
+    invite_link = await checkout_invite(cb.bot)
 
-    # 2) Проверяем, есть ли в БД пользователь
     async with async_session() as sess:
-        user_in_db = await sess.scalar(
-            select(User).where(User.telegram_id == msg.from_user.id)
+        await sess.execute(
+            update(User)
+            .where(User.telegram_id == cb.from_user.id)
+            .values(invite_link=invite_link)
         )
+        await sess.execute(notify_user_changed(cb.from_user.id))
+        await sess.commit()
 
-        if user_in_db:
-            # — уже был зарегистрирован: обновляем invite + registered_at
-            await sess.execute(
-                update(User)
-                .where(User.telegram_id == msg.from_user.id)
-                .values(invite_link=invite_link, registered_at=datetime.utcnow())
-            )
-            await sess.commit()
-
-            # Для уже зареганного пользователя отправляем только кнопку WebApp
-            button = InlineKeyboardButton(
-                text="Подключиться к чату",
-                web_app=WebAppInfo(url=f"{settings.webapp_url}/?uid={msg.from_user.id}")
-            )
-            kb = InlineKeyboardMarkup(inline_keyboard=[[button]])
-            await msg.answer(GIFT_TEXT, reply_markup=kb)
-
-        else:
-            # — впервые: создаём «заглушку»
-            new_user = User(
-                telegram_id=msg.from_user.id,
-                username=msg.from_user.username,
-                invite_link=invite_link,
-                # fio/specialization/email — оставляем None
-            )
-            sess.add(new_user)
-            await sess.commit()
-
-            # 3) Планируем проверку через 5 дней (для теста — 10 секунд)
-            run_date = datetime.utcnow() + timedelta(days=5)
-            scheduler.add_job(
-                func=cleanup_unregistered,
-                trigger=IntervalTrigger(days=5, start_date=run_date),
-                args=[msg.from_user.id],
-                id=f"remind_spec_{msg.from_user.id}",
-                replace_existing=True,
-            )
-
-            # 4) Формируем клавиатуру — для новых пользователей это прямая ссылка
-            button = InlineKeyboardButton(
-                text="Подключиться к чату",
-                url=invite_link
-            )
-            kb = InlineKeyboardMarkup(inline_keyboard=[[button]])
-
-            # 5) Отправляем GIFT_TEXT с клавиатурой
-            await msg.answer(GIFT_TEXT, reply_markup=kb)
+    button = InlineKeyboardButton(text="Подключиться к чату", url=invite_link)
+    await cb.message.edit_reply_markup(
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[[button]])
+    )
+    await cb.answer("Ссылка готова — нажмите кнопку ещё раз")
@@ -1,5 +1,6 @@
 import datetime as dt
-from sqlalchemy import String, DateTime, BigInteger
+from sqlalchemy import String, DateTime, BigInteger, Integer, Float, Text, ForeignKey, Index, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column
 from .db import Base
 
@@ -11,9 +12,146 @@ class User(Base):
     fio:         Mapped[str | None] = mapped_column(String(255), nullable=True)
     specialization: Mapped[str | None] = mapped_column(String(255), nullable=True)
     email:       Mapped[str | None] = mapped_column(String(255), nullable=True)
-    invite_link: Mapped[str]       = mapped_column(String(512), nullable=False)
+    # создаётся лениво — при нажатии «Подключиться к чату» или регистрации в webapp
+    invite_link: Mapped[str | None] = mapped_column(String(512), nullable=True)
     registered_at: Mapped[dt.datetime] = mapped_column(
         DateTime, default=dt.datetime.utcnow, nullable=False
     )
+    # заблокировал бота / удалил аккаунт: не шлём рассылки и напоминания до /start
+    unreachable_at:     Mapped[dt.datetime | None] = mapped_column(DateTime, nullable=True)
+    unreachable_reason: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    last_reminded_at:   Mapped[dt.datetime | None] = mapped_column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # выборка «кому пора напомнить» в scheduler.send_due_reminders
+        Index(
+            "ix_users_reminder_due",
+            text("greatest(registered_at, last_reminded_at)"),
+            postgresql_where=text("specialization IS NULL AND unreachable_at IS NULL"),
+        ),
+        # сегмент рассылки по специальности: страницы по telegram_id
+        # (services.audience) читаются из индекса уже в нужном порядке
+        Index(
+            "ix_users_specialization_reachable",
+            "specialization", "telegram_id",
+            postgresql_where=text("unreachable_at IS NULL"),
+        ),
+        # сегмент по дате регистрации и подсчёт аудитории для предпросмотра
+        Index(
+            "ix_users_registered_at_reachable",
+            "registered_at",
+            postgresql_where=text("unreachable_at IS NULL"),
+        ),
+    )
+
+
+class BroadcastJob(Base):
+    """
+    Рассылка как задание: контент + курсор по telegram_id, до которого
+    получатели уже взяты в работу. По курсору рассылка продолжается после рестарта.
+    """
+    __tablename__ = "broadcast_jobs"
+
+    id:          Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    created_by:  Mapped[int] = mapped_column(BigInteger, nullable=False)
+    caption:     Mapped[str] = mapped_column(Text, nullable=False, default="")
+    # JSON-строки в том же формате, что принимает services.broadcast.broadcast
+    caption_entities: Mapped[str | None] = mapped_column(Text, nullable=True)
+    file_ids:    Mapped[str | None] = mapped_column(Text, nullable=True)
+    # JSON services.audience.AudienceFilter; NULL — все пользователи
+    audience:    Mapped[str | None] = mapped_column(Text, nullable=True)
+    # [scheduled →] running → done | cancelled
+    status:      Mapped[str] = mapped_column(String(16), nullable=False, default="running")
+    # отложенный запуск (UTC); для окна доставки — его начало
+    scheduled_at:   Mapped[dt.datetime | None] = mapped_column(DateTime, nullable=True)
+    # растянуть рассылку на столько секунд
+    window_seconds: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # не больше стольких сообщений в секунду (поверх общего лимита)
+    max_rate:       Mapped[float | None] = mapped_column(Float, nullable=True)
+    last_telegram_id: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    sent:        Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    failed:      Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    created_at:  Mapped[dt.datetime] = mapped_column(
+        DateTime, default=dt.datetime.utcnow, nullable=False
+    )
+    finished_at: Mapped[dt.datetime | None] = mapped_column(DateTime, nullable=True)
+    # сообщение администратору, в котором обновляется прогресс
+    progress_chat_id:    Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    progress_message_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
 
 
+class BroadcastDelivery(Base):
+    """
+    Журнал доставки рассылки по получателям.
+    pending — взят в работу, исход неизвестен; sent / failed — итог отправки;
+    unknown — процесс упал между взятием и записью итога (повторно не шлём).
+    """
+    __tablename__ = "broadcast_deliveries"
+
+    job_id:      Mapped[int] = mapped_column(
+        Integer, ForeignKey("broadcast_jobs.id", ondelete="CASCADE"), primary_key=True
+    )
+    telegram_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    status:      Mapped[str] = mapped_column(String(16), nullable=False, default="pending")
+    error:       Mapped[str | None] = mapped_column(String(255), nullable=True)
+
+
+class InviteLink(Base):
+    """
+    Пул заранее созданных ссылок-приглашений в чат.
+    Ссылка выдаётся один раз: при выдаче строка удаляется.
+    """
+    __tablename__ = "invite_links"
+
+    id:         Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    link:       Mapped[str] = mapped_column(String(512), nullable=False, unique=True)
+    created_at: Mapped[dt.datetime] = mapped_column(
+        DateTime, default=dt.datetime.utcnow, nullable=False
+    )
+
+
+class RegisterOutbox(Base):
+    """
+    Отложенные действия в Telegram после регистрации в webapp
+    (разбан в чате + ссылка-приглашение). Одна строка на пользователя —
+    повторная регистрация не создаёт дублей, а перезапускает запрос.
+    """
+    __tablename__ = "register_outbox"
+
+    telegram_id:     Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # момент последнего запроса: по нему отличаем повторную регистрацию
+    requested_at:    Mapped[dt.datetime] = mapped_column(DateTime, nullable=False)
+    next_attempt_at: Mapped[dt.datetime] = mapped_column(DateTime, nullable=False, index=True)
+    attempts:        Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_error:      Mapped[str | None] = mapped_column(String(255), nullable=True)
+
+
+class FsmState(Base):
+    """Состояния FSM aiogram, общие для всех процессов бота (services.fsm_storage)."""
+    __tablename__ = "fsm_states"
+
+    key:   Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    data:  Mapped[dict] = mapped_column(JSONB, nullable=False, default=dict)
+    updated_at: Mapped[dt.datetime] = mapped_column(
+        DateTime, default=dt.datetime.utcnow, nullable=False
+    )
+
+
+class MediaGroupPart(Base):
+    """
+    Части альбома, присланного администратором для рассылки, пока альбом
+    не собран целиком (services.media_groups). Хранятся только file_id.
+    """
+    __tablename__ = "media_group_parts"
+
+    media_group_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    message_id:     Mapped[int] = mapped_column(Integer, primary_key=True)
+    chat_id:        Mapped[int] = mapped_column(BigInteger, nullable=False)
+    user_id:        Mapped[int] = mapped_column(BigInteger, nullable=False)
+    caption:        Mapped[str | None] = mapped_column(Text, nullable=True)
+    caption_entities: Mapped[list | None] = mapped_column(JSONB, nullable=True)
+    file:           Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    received_at:    Mapped[dt.datetime] = mapped_column(
+        DateTime, server_default=text("LOCALTIMESTAMP"), nullable=False
+    )
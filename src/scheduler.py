@@ -1,106 +1,349 @@
 # src/bot/scheduler.py
+import asyncio
 import logging
-from datetime import timedelta, datetime
+from datetime import timedelta, datetime, timezone
+from time import perf_counter
 
 from aiogram.types import InlineKeyboardMarkup, WebAppInfo, InlineKeyboardButton
+from apscheduler.executors.asyncio import AsyncIOExecutor
 from apscheduler.jobstores.base import JobLookupError
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.schedulers.asyncio import AsyncIOScheduler, run_in_event_loop
 from aiogram import Bot
+from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.interval import IntervalTrigger
-from sqlalchemy import select, update
+from sqlalchemy import select, update, func, create_engine, text
 from src.db import async_session
 from src.models import User
 from src.config import settings
-from aiogram.exceptions import TelegramBadRequest
+from src.services.broadcast import deliver
+from src.services.broadcast_jobs import resume_jobs, activate_job, start_job
+from src.services.invite import refill_invite_pool
+from src.services.outbound import Priority, outbound_priority
+from src.services.reachability import UnreachableMarker
 
 
-scheduler = AsyncIOScheduler(jobstores={
-    'default': SQLAlchemyJobStore(url='sqlite:///jobs.sqlite')
-})
+# APScheduler 3 умеет только синхронные jobstore, поэтому задачи лежат в той же
+# базе Postgres, но через синхронный драйвер (как в alembic/env.py), а весь
+# I/O планировщика выполняется в потоке, а не в event loop.
+jobstore_engine = create_engine(
+    str(settings.database_url).replace("+asyncpg", "+psycopg2"),
+    pool_size=3,
+    max_overflow=0,
+    pool_pre_ping=True,
+)
+jobstore = SQLAlchemyJobStore(engine=jobstore_engine)
 
-async def reschedule_reminders_on_start():
-    async with async_session() as sess:
-        result = await sess.execute(
-            select(User).where(User.specialization == None)
-        )
-        users = result.scalars().all()
-
-        for user in users:
-            try:
-                run_date = user.registered_at + timedelta(days=5)
-                scheduler.add_job(
-                    func=cleanup_unregistered,
-                    trigger=IntervalTrigger(days=5, start_date=run_date),
-                    args=[user.telegram_id],
-                    id=f"remind_spec_{user.telegram_id}",
-                    replace_existing=True,
-                )
-            except Exception as e:
-                logging.warning(f"Не удалось пересоздать задачу для {user.telegram_id}: {e}")
+# advisory lock, под которым копия бота обрабатывает очередь задач
+JOBS_LOCK_KEY = 0x5245434C
+# как часто перечитывать jobstore, даже если локально ничего не менялось:
+# задачи могли добавить или забрать другие копии бота
+MAX_WAKEUP_INTERVAL = 60
 
 
-async def cleanup_unregistered(telegram_id: int):
+class _ThreadSafeAsyncIOExecutor(AsyncIOExecutor):
     """
-    Runs every 5 days starting 5 days after /start:
-     - if specialization still null → DM reminder
-     - otherwise → remove this job (no more reminders)
+    AsyncIOExecutor, которому можно передавать задачи из чужого потока:
+    сам запуск корутины переносится в event loop.
     """
-    async with async_session() as sess:
-        user = await sess.scalar(
-            select(User).where(User.telegram_id == telegram_id)
-        )
-        if not user:
-            return
 
-        if user.specialization:
-            try:
-                scheduler.remove_job(f"remind_spec_{telegram_id}")
-            except JobLookupError:
-                pass
+    def _do_submit_job(self, job, run_times):
+        self._eventloop.call_soon_threadsafe(super()._do_submit_job, job, run_times)
+
+
+class PostgresAsyncIOScheduler(AsyncIOScheduler):
+    """
+    AsyncIOScheduler, который обрабатывает jobstore в пуле потоков.
+    Обработка идёт под транзакционным advisory lock в Postgres: если
+    запущено несколько копий бота, задачи в один момент разбирает только одна,
+    а остальные видят уже сдвинутое next_run_time и не запускают их повторно.
+    """
+
+    _processing = False
+    _wakeup_again = False
+    # параллельные start_paused (сверка задач лидером и /broadcast) не должны запустить его дважды
+    _start_lock = asyncio.Lock()
+
+    def _create_default_executor(self):
+        return _ThreadSafeAsyncIOExecutor()
+
+    def _process_jobs_locked(self):
+        with jobstore_engine.connect() as conn, conn.begin():
+            locked = conn.scalar(
+                text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": JOBS_LOCK_KEY}
+            )
+            if not locked:
+                return MAX_WAKEUP_INTERVAL
+            return self._process_jobs()
+
+    @run_in_event_loop
+    def wakeup(self):
+        self._stop_timer()
+        if self._processing:
+            self._wakeup_again = True
             return
+        self._processing = True
+        future = self._eventloop.run_in_executor(None, self._process_jobs_locked)
+        future.add_done_callback(self._on_processed)
 
-        # Otherwise, send the *reminder* message
-        bot = Bot(token=settings.bot_token)
+    async def start_paused(self):
+        """
+        start(paused=True) вне event loop: SQLAlchemyJobStore.start синхронно
+        подключается к Postgres и выполняет CREATE TABLE IF NOT EXISTS.
+        """
+        async with self._start_lock:
+            if self.running:
+                return
+            # start() в потоке не найдёт цикл сам — передаём его заранее
+            if not self._eventloop:
+                self._eventloop = asyncio.get_running_loop()
+            await asyncio.to_thread(self.start, paused=True)
+
+    def _on_processed(self, future):
+        self._processing = False
         try:
-            kb = InlineKeyboardMarkup(
-                inline_keyboard=[[
-                    InlineKeyboardButton(
-                        text="Заполнить специальность",
-                        web_app=WebAppInfo(
-                            url=f"{settings.webapp_url}/?uid={telegram_id}"
-                        )
-                    )
-                ]]
+            wait_seconds = future.result()
+        except Exception:
+            logging.exception("Scheduler failed to process jobs")
+            wait_seconds = MAX_WAKEUP_INTERVAL
+        if self._wakeup_again:
+            self._wakeup_again = False
+            self.wakeup()
+            return
+        if wait_seconds is None or wait_seconds > MAX_WAKEUP_INTERVAL:
+            wait_seconds = MAX_WAKEUP_INTERVAL
+        self._start_timer(wait_seconds)
+
+
+scheduler = PostgresAsyncIOScheduler(jobstores={
+    'default': jobstore
+})
+
+# напоминание о специальности: через 5 дней после /start и дальше каждые 5 дней
+REMINDER_EVERY = timedelta(days=5)
+# как часто проверяем, кому пора напомнить
+SWEEP_EVERY = timedelta(minutes=10)
+SWEEP_JOB_ID = "reminder_sweep"
+# сколько пользователей выбираем за один запрос
+SWEEP_BATCH = 500
+# как часто проверяем запас ссылок-приглашений
+INVITE_REFILL_EVERY = timedelta(minutes=1)
+INVITE_REFILL_JOB_ID = "invite_pool_refill"
+# как часто ищем рассылки, брошенные упавшим процессом
+RESUME_BROADCASTS_EVERY = timedelta(minutes=1)
+RESUME_BROADCASTS_JOB_ID = "resume_broadcasts"
+# отложенные рассылки: задача на дату, id = префикс + id задания рассылки
+SCHEDULED_BROADCAST_PREFIX = "broadcast_"
+
+REMINDER_TEXT = (
+    "Коллега, просим тебя внести специальность — "
+    "это нужно, чтобы мы с командой подбирали материалы, "
+    "которые действительно будут полезны именно тебе."
+)
+
+# бот, через которого уходят напоминания; задаётся в setup_scheduler
+_bot: Bot | None = None
+
+
+def reminder_due(now: datetime):
+    """
+    Условие «пора напомнить»: специальность не заполнена, пользователь
+    достижим и с момента /start (или последнего напоминания) прошло 5 дней.
+    """
+    return (
+        User.specialization.is_(None),
+        User.unreachable_at.is_(None),
+        # GREATEST в Postgres игнорирует NULL
+        func.greatest(User.registered_at, User.last_reminded_at) <= now - REMINDER_EVERY,
+    )
+
+
+async def send_due_reminders():
+    """
+    Единственная периодическая задача напоминаний: одним индексированным
+    запросом (пачками по telegram_id) выбирает всех, кому пора напомнить,
+    и шлёт через общего бота: в общей очереди напоминания уступают ответам
+    пользователям, но идут раньше рассылок.
+    """
+    with outbound_priority(Priority.REMINDER):
+        await _send_due_reminders()
+
+
+async def _send_due_reminders():
+    now = datetime.utcnow()
+    unreachable = UnreachableMarker()
+    after = 0
+    total_sent = total_failed = 0
+
+    async def send(uid: int):
+        kb = InlineKeyboardMarkup(
+            inline_keyboard=[[
+                InlineKeyboardButton(
+                    text="Заполнить специальность",
+                    web_app=WebAppInfo(url=f"{settings.webapp_url}/?uid={uid}")
+                )
+            ]]
+        )
+        await _bot.send_message(chat_id=uid, text=REMINDER_TEXT, reply_markup=kb)
+
+    while True:
+        async with async_session() as sess:
+            result = await sess.execute(
+                select(User.telegram_id)
+                .where(User.telegram_id > after, *reminder_due(now))
+                .order_by(User.telegram_id)
+                .limit(SWEEP_BATCH)
             )
-            await bot.send_message(
-                chat_id=telegram_id,
-                text=(
-                    "Коллега, просим тебя внести специальность — "
-                    "это нужно, чтобы мы с командой подбирали материалы, "
-                    "которые действительно будут полезны именно тебе."
-                ),
-                reply_markup=kb
+            ids = result.scalars().all()
+        if not ids:
+            break
+        after = ids[-1]
+
+        sent, failed = await deliver(
+            ids,
+            send,
+            concurrency=settings.broadcast_concurrency,
+            on_unreachable=unreachable.add,
+        )
+        total_sent += sent
+        total_failed += failed
+
+        # отмечаем попытку у всей пачки — следующее напоминание через REMINDER_EVERY
+        async with async_session() as sess:
+            await sess.execute(
+                update(User)
+                .where(User.telegram_id.in_(ids))
+                .values(last_reminded_at=now)
             )
-        except TelegramBadRequest as e:
-            logging.warning(f"Failed to send reminder to {telegram_id}: {e}")
-        finally:
-            await bot.session.close()
+            await sess.commit()
+
+    await unreachable.flush()
+    if total_sent or total_failed:
+        logging.info(f"Reminder sweep: sent={total_sent}, failed={total_failed}")
 
 
-def setup_scheduler(bot: Bot):
+async def refill_invites():
+    await refill_invite_pool(_bot)
+
+
+async def resume_broadcasts():
+    # resume_jobs только запускает задания фоновыми задачами и сразу возвращается
+    await resume_jobs(
+        _bot,
+        rate=settings.broadcast_rate,
+        concurrency=settings.broadcast_concurrency,
+    )
+
+
+async def start_scheduled_broadcast(job_id: int):
+    """Наступило время отложенной рассылки: запускаем её, если её не отменили."""
+    if not await activate_job(job_id):
+        logging.info(f"Scheduled broadcast #{job_id} is no longer pending, skipping")
+        return
+    logging.info(f"Starting scheduled broadcast #{job_id}")
+    start_job(
+        _bot,
+        job_id,
+        rate=settings.broadcast_rate,
+        concurrency=settings.broadcast_concurrency,
+    )
+
+
+async def schedule_broadcast(job_id: int, run_at: datetime):
+    """
+    Ставит запуск отложенной рассылки в общий jobstore — задача переживает
+    рестарт и выполняется лидером. run_at — в UTC (naive, как в моделях).
+    В процессе, который не лидер, планировщик запускается на паузе: задача
+    только записывается в jobstore, а лидер подхватит её при следующем
+    перечитывании (не позже чем через MAX_WAKEUP_INTERVAL).
+    """
+    await scheduler.start_paused()
+    await asyncio.to_thread(
+        scheduler.add_job,
+        func=start_scheduled_broadcast,
+        trigger=DateTrigger(run_date=run_at.replace(tzinfo=timezone.utc)),
+        args=[job_id],
+        id=f"{SCHEDULED_BROADCAST_PREFIX}{job_id}",
+        replace_existing=True,
+        # бот мог лежать в назначенное время — запускаем, как только поднимется
+        misfire_grace_time=None,
+        coalesce=True,
+    )
+    logging.info(f"Broadcast #{job_id} scheduled at {run_at:%Y-%m-%d %H:%M} UTC")
+
+
+async def unschedule_broadcast(job_id: int):
+    """
+    Убирает запуск отменённой отложенной рассылки из jobstore (напрямую —
+    в этом процессе планировщик может быть не запущен). Если не убрать,
+    задача всё равно ничего не сделает: задание уже не в статусе scheduled.
+    """
+    try:
+        await asyncio.to_thread(jobstore.remove_job, f"{SCHEDULED_BROADCAST_PREFIX}{job_id}")
+    except JobLookupError:
+        pass
+
+
+def _ensure_interval_job(job_id: str, func, every: timedelta) -> None:
+    """Создаёт периодическую задачу, только если её нет или изменилось расписание."""
+    trigger = IntervalTrigger(seconds=int(every.total_seconds()))
+    job = scheduler.get_job(job_id)
+    if (
+        job is None
+        or job.func is not func
+        or getattr(job.trigger, "interval", None) != trigger.interval
+    ):
+        scheduler.add_job(
+            func=func,
+            trigger=trigger,
+            id=job_id,
+            replace_existing=True,
+            coalesce=True,
+            max_instances=1,
+        )
+        logging.info(f"Job {job_id} (re)created")
+
+
+def _reconcile_jobs() -> None:
+    """
+    Приводит содержимое jobstore к нужному виду, трогая только то, что
+    отличается: удаляет задачи старой схемы (по одной на пользователя)
+    одним DELETE и пересоздаёт периодические задачи (напоминания, пополнение
+    пула ссылок, подхват брошенных рассылок), только если их нет или
+    изменилось расписание.
+    Синхронный I/O — вызывается в отдельном потоке.
+    """
+    with jobstore.engine.begin() as conn:
+        removed = conn.execute(
+            jobstore.jobs_t.delete().where(jobstore.jobs_t.c.id.like("remind_spec_%"))
+        ).rowcount
+    if removed:
+        logging.info(f"Removed {removed} legacy per-user reminder jobs")
+
+    # одна периодическая задача на всех пользователей вместо задачи на каждого
+    _ensure_interval_job(SWEEP_JOB_ID, send_due_reminders, SWEEP_EVERY)
+    _ensure_interval_job(INVITE_REFILL_JOB_ID, refill_invites, INVITE_REFILL_EVERY)
+    _ensure_interval_job(RESUME_BROADCASTS_JOB_ID, resume_broadcasts, RESUME_BROADCASTS_EVERY)
+
+
+async def setup_scheduler(bot: Bot):
     """
     Call this once at startup.  It both schedules your jobs
     *and* actually kicks the scheduler off.
+    Работа с jobstore вынесена из event loop; пока задачи сверяются,
+    планировщик стоит на паузе, чтобы не выполнить устаревшие задачи.
     """
-    # you can schedule other recurring or date‑based jobs here, e.g.:
-    # scheduler.add_job(my_recurring, 'interval', hours=1, args=[…])
+    global _bot
+    _bot = bot
+
+    started = perf_counter()
+    await scheduler.start_paused()
+    await asyncio.to_thread(_reconcile_jobs)
+    scheduler.resume()
+    logging.info(f"Scheduler ready in {perf_counter() - started:.3f}s")
 
-    # *** schedule your per-user cleanup jobs when /start runs ***
-    # In your /start handler you did:
-    #   scheduler.add_job(…, trigger='date', run_date=…, args=[user_id], id=…)
-    #
-    # so here we only need to start the scheduler itself:
 
-    if not scheduler.running:
-        scheduler.start()
\ No newline at end of file
+async def pause_scheduler():
+    """Процесс перестал быть лидером — задачи выполняет новый лидер."""
+    if scheduler.running:
+        scheduler.pause()
@@ -0,0 +1,108 @@
+# services/audience.py
+
+import datetime as dt
+import json
+from dataclasses import dataclass, asdict
+from typing import AsyncIterator
+
+from sqlalchemy import select, func, ColumnElement
+
+from ..db import async_session
+from ..models import User
+
+PAGE_SIZE = 500
+
+
+@dataclass(frozen=True)
+class AudienceFilter:
+    """
+    Условия отбора получателей; превращаются в WHERE на стороне Postgres.
+    Пустой фильтр — все достижимые пользователи (недостижимые исключаются всегда).
+    """
+    specializations: tuple[str, ...] = ()
+    registered_from: dt.datetime | None = None
+    registered_to:   dt.datetime | None = None
+    # только заполнившие анкету (ФИО и специальность — как в webapp)
+    completed_only:  bool = False
+
+    def clauses(self) -> list[ColumnElement[bool]]:
+        clauses = [User.unreachable_at.is_(None)]
+        if self.completed_only:
+            clauses += [User.fio.is_not(None), User.specialization.is_not(None)]
+        if self.specializations:
+            clauses.append(User.specialization.in_(self.specializations))
+        if self.registered_from is not None:
+            clauses.append(User.registered_at >= self.registered_from)
+        if self.registered_to is not None:
+            clauses.append(User.registered_at < self.registered_to)
+        return clauses
+
+    def to_json(self) -> str:
+        data = asdict(self)
+        for key in ("registered_from", "registered_to"):
+            if data[key] is not None:
+                data[key] = data[key].isoformat()
+        return json.dumps(data, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, raw: str | None) -> "AudienceFilter":
+        if not raw:
+            return cls()
+        data = json.loads(raw)
+        return cls(
+            specializations=tuple(data.get("specializations") or ()),
+            registered_from=dt.datetime.fromisoformat(data["registered_from"]) if data.get("registered_from") else None,
+            registered_to=dt.datetime.fromisoformat(data["registered_to"]) if data.get("registered_to") else None,
+            completed_only=bool(data.get("completed_only")),
+        )
+
+
+async def iter_recipient_pages(
+    audience: AudienceFilter | None = None,
+    *,
+    after: int = 0,
+    page_size: int = PAGE_SIZE,
+) -> AsyncIterator[list[int]]:
+    """
+    Отдаёт telegram_id получателей страницами по возрастанию (keyset-пагинация
+    по первичному ключу): каждая страница — отдельный короткий запрос,
+    поэтому первая отправка не ждёт выборки всей таблицы, а память не растёт
+    с числом пользователей.
+    """
+    clauses = (audience or AudienceFilter()).clauses()
+    while True:
+        async with async_session() as sess:
+            result = await sess.execute(
+                select(User.telegram_id)
+                .where(User.telegram_id > after, *clauses)
+                .order_by(User.telegram_id)
+                .limit(page_size)
+            )
+            ids = result.scalars().all()
+        if not ids:
+            return
+        yield ids
+        after = ids[-1]
+
+
+async def count_recipients(audience: AudienceFilter | None = None, *, after: int = 0) -> int:
+    async with async_session() as sess:
+        return await sess.scalar(
+            select(func.count())
+            .select_from(User)
+            .where(User.telegram_id > after, *(audience or AudienceFilter()).clauses())
+        )
+
+
+async def specialization_counts(limit: int | None = None) -> list[tuple[str, int]]:
+    """Специальности достижимых пользователей с числом людей, по убыванию."""
+    count = func.count().label("count")
+    async with async_session() as sess:
+        result = await sess.execute(
+            select(User.specialization, count)
+            .where(User.specialization.is_not(None), User.unreachable_at.is_(None))
+            .group_by(User.specialization)
+            .order_by(count.desc(), User.specialization)
+            .limit(limit)
+        )
+        return [tuple(row) for row in result.all()]
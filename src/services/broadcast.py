@@ -2,29 +2,168 @@
 
 import asyncio
 import logging
-from typing import Sequence
+from dataclasses import dataclass
+from typing import Any, AsyncIterable, Awaitable, Callable, Iterable
 from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+from aiogram.methods import (
+    TelegramMethod, SendMessage, SendPhoto, SendDocument, SendVideo, SendMediaGroup
+)
 from aiogram.types import (
-    Message, InputMediaPhoto, InputMediaDocument, InputMediaVideo, MessageEntity
+    InputMediaPhoto, InputMediaDocument, InputMediaVideo, MessageEntity
 )
 import json
 
-async def broadcast(
+from .ratelimit import TokenBucket, JobLimiter, ChatPacer
+
+logger = logging.getLogger(__name__)
+
+# Telegram разрешает ~30 сообщений/с в разные чаты — оставляем запас
+DEFAULT_RATE = 25.0
+DEFAULT_CONCURRENCY = 8
+# сколько раз повторяем отправку одному пользователю после RetryAfter
+MAX_RETRIES = 3
+
+# on_result(uid, error): error is None при успешной отправке
+ResultCallback = Callable[[int, str | None], Awaitable[None]]
+# on_unreachable(uid, reason): пользователь больше не может получать сообщения
+UnreachableCallback = Callable[[int, str], Awaitable[None]]
+
+
+def unreachable_reason(exc: Exception) -> str | None:
+    """
+    Классифицирует ошибку отправки: если пользователь недостижим навсегда
+    (заблокировал бота, удалил аккаунт), возвращает причину, иначе None.
+    """
+    text = str(exc).lower()
+    if isinstance(exc, TelegramForbiddenError):
+        if "blocked" in text:
+            return "blocked"
+        if "deactivated" in text:
+            return "deactivated"
+        return "forbidden"
+    if isinstance(exc, TelegramBadRequest) and "chat not found" in text:
+        return "chat_not_found"
+    return None
+
+
+async def deliver(
+    tg_ids: Iterable[int] | AsyncIterable[int],
+    send: Callable[[int], Awaitable[Any]],
+    *,
+    limiter: TokenBucket | JobLimiter | None = None,
+    pacer: ChatPacer | None = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    cost: float = 1.0,
+    max_retries: int = MAX_RETRIES,
+    on_start: Callable[[int], None] | None = None,
+    on_result: ResultCallback | None = None,
+    on_unreachable: UnreachableCallback | None = None,
+) -> tuple[int, int]:
+    """
+    Прогоняет `send(uid)` для каждого получателя пулом из `concurrency` воркеров.
+    Общий бюджет бота распределяет очередь исходящих сообщений (см. outbound);
+    `limiter`, если передан, задаёт собственный темп: каждая попытка берёт
+    из него `cost` токенов. Пауза на чат — через `pacer`. На TelegramRetryAfter
+    лимитер останавливается ровно на присланную сервером задержку, после чего
+    отправка тому же пользователю повторяется.
+    `tg_ids` может быть и асинхронным генератором — получатели берутся по мере отправки.
+    `on_start` вызывается, когда воркер берёт получателя в отправку,
+    `on_result` — после итоговой попытки по каждому получателю,
+    `on_unreachable` — если ошибка означает, что писать пользователю бесполезно.
+    :return: (отправлено, ошибок)
+    """
+    pacer = pacer or ChatPacer()
+    queue: asyncio.Queue[int | None] = asyncio.Queue(maxsize=concurrency * 2)
+    sent = 0
+    failed = 0
+
+    async def send_one(uid: int) -> str | None:
+        for _ in range(max_retries + 1):
+            await pacer.wait(uid)
+            if limiter is not None:
+                await limiter.acquire(cost)
+            try:
+                await send(uid)
+                return None
+            except TelegramRetryAfter as e:
+                logger.info("[broadcast] RetryAfter %ss на пользователе %s", e.retry_after, uid)
+                if limiter is not None:
+                    limiter.pause(e.retry_after)
+            except Exception as e:
+                reason = unreachable_reason(e)
+                if reason is None:
+                    logger.warning("[broadcast] Не удалось отправить пользователю %s: %s", uid, e)
+                else:
+                    logger.info("[broadcast] Пользователь %s недостижим (%s)", uid, reason)
+                    if on_unreachable is not None:
+                        await on_unreachable(uid, reason)
+                return str(e)
+        logger.warning("[broadcast] Пользователь %s: исчерпаны повторы после RetryAfter", uid)
+        return "retry limit exceeded"
+
+    async def worker() -> None:
+        nonlocal sent, failed
+        while (uid := await queue.get()) is not None:
+            if on_start is not None:
+                on_start(uid)
+            error = await send_one(uid)
+            if error is None:
+                sent += 1
+            else:
+                failed += 1
+            if on_result is not None:
+                await on_result(uid, error)
+
+    async def producer() -> None:
+        if isinstance(tg_ids, AsyncIterable):
+            async for uid in tg_ids:
+                await queue.put(uid)
+        else:
+            for uid in tg_ids:
+                await queue.put(uid)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(producer())
+        for _ in range(concurrency):
+            tg.create_task(worker())
+
+    return sent, failed
+
+
+@dataclass(frozen=True)
+class BroadcastPayload:
+    """
+    Запрос к Bot API, собранный один раз на всю рассылку.
+    Все поля, кроме chat_id, уже сериализованы в том виде, в каком уходят
+    в Telegram, поэтому на получателя остаётся только подставить chat_id.
+    """
+    method: TelegramMethod
+    # сколько сообщений Telegram засчитывает за один запрос
+    cost: int = 1
+
+    def for_chat(self, chat_id: int) -> TelegramMethod:
+        return self.method.model_copy(update={"chat_id": chat_id})
+
+
+_INPUT_MEDIA = {
+    "photo": InputMediaPhoto,
+    "document": InputMediaDocument,
+    "video": InputMediaVideo,
+}
+
+
+def compile_payload(
     bot: Bot,
-    tg_ids: Sequence[int],
     *,
     caption: str = "",
     caption_entities: str | None = None,
     file_ids: str | None = None,
-    throttle: float = 0.05,
-) -> tuple[int, int]:
+) -> BroadcastPayload:
     """
-    Рассылает сообщение с вложениями (если есть) и caption пользователям.
-    :param bot: экземпляр бота
-    :param tg_ids: список ID пользователей
-    :param caption: текст сообщения или подпись к файлу
-    :param caption_entities: сериализованные caption_entities
-    :param file_ids: JSON-строка с массивом словарей: [{"type": "photo", "file_id": "..."}]
+    Собирает шаблон запроса рассылки. Аргументы — как у broadcast().
     """
     attachments = json.loads(file_ids) if file_ids else []
     entities = (
@@ -33,44 +172,86 @@ async def broadcast(
         else None
     )
 
-    sent = 0
-    failed = 0
+    if len(attachments) > 1:
+        media = []
+        for idx, att in enumerate(attachments):
+            is_first = idx == 0
+            media.append(_INPUT_MEDIA[att["type"]](
+                media=att["file_id"],
+                caption=caption if is_first else None,
+                caption_entities=entities if is_first else None,
+                parse_mode=None,
+            ))
+        method = SendMediaGroup(chat_id=0, media=media)
+    elif attachments:
+        typ, fid = attachments[0]["type"], attachments[0]["file_id"]
+        if typ == "photo":
+            method = SendPhoto(chat_id=0, photo=fid, caption=caption, caption_entities=entities, parse_mode=None)
+        elif typ == "document":
+            method = SendDocument(chat_id=0, document=fid, caption=caption, caption_entities=entities, parse_mode=None)
+        else:
+            method = SendVideo(chat_id=0, video=fid, caption=caption, caption_entities=entities, parse_mode=None)
+    else:
+        method = SendMessage(chat_id=0, text=caption, entities=entities, parse_mode=None)
 
-    for uid in tg_ids:
-        try:
-            if attachments:
-                if len(attachments) > 1:
-                    media = []
-                    for idx, att in enumerate(attachments):
-                        media_type = att["type"]
-                        file_id = att["file_id"]
-                        is_first = idx == 0
-                        caption_part = caption if is_first else None
-                        ent = entities if is_first else None
-
-                        if media_type == "photo":
-                            media.append(InputMediaPhoto(media=file_id, caption=caption_part, caption_entities=ent, parse_mode=None))
-                        elif media_type == "document":
-                            media.append(InputMediaDocument(media=file_id, caption=caption_part, caption_entities=ent, parse_mode=None))
-                        elif media_type == "video":
-                            media.append(InputMediaVideo(media=file_id, caption=caption_part, caption_entities=ent, parse_mode=None))
-                    await bot.send_media_group(chat_id=uid, media=media)
-                else:
-                    file = attachments[0]
-                    typ, fid = file["type"], file["file_id"]
-                    if typ == "photo":
-                        await bot.send_photo(chat_id=uid, photo=fid, caption=caption, caption_entities=entities, parse_mode=None)
-                    elif typ == "document":
-                        await bot.send_document(chat_id=uid, document=fid, caption=caption, caption_entities=entities, parse_mode=None)
-                    elif typ == "video":
-                        await bot.send_video(chat_id=uid, video=fid, caption=caption, caption_entities=entities, parse_mode=None)
-            else:
-                await bot.send_message(chat_id=uid, text=caption, entities=entities, parse_mode=None)
-            sent += 1
-        except Exception as e:
-            logging.warning(f"[broadcast] Не удалось отправить пользователю {uid}: {e}")
-            failed += 1
+    # сериализуем media/entities и подставляем умолчания бота один раз
+    prepared = {
+        name: bot.session.prepare_value(value, bot=bot, files={})
+        for name, value in method.model_dump(warnings=False).items()
+        if name != "chat_id"
+    }
+    return BroadcastPayload(
+        method=method.model_copy(update=prepared),
+        cost=max(len(attachments), 1),
+    )
 
-        await asyncio.sleep(throttle)
 
-    return sent, failed
+async def broadcast(
+    bot: Bot,
+    tg_ids: Iterable[int] | AsyncIterable[int],
+    *,
+    caption: str = "",
+    caption_entities: str | None = None,
+    file_ids: str | None = None,
+    rate: float = DEFAULT_RATE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    limiter: TokenBucket | JobLimiter | None = None,
+    on_start: Callable[[int], None] | None = None,
+    on_result: ResultCallback | None = None,
+    on_unreachable: UnreachableCallback | None = None,
+) -> tuple[int, int]:
+    """
+    Рассылает сообщение с вложениями (если есть) и caption пользователям.
+    :param bot: экземпляр бота
+    :param tg_ids: ID пользователей (список или асинхронный генератор)
+    :param caption: текст сообщения или подпись к файлу
+    :param caption_entities: сериализованные caption_entities
+    :param file_ids: JSON-строка с массивом словарей: [{"type": "photo", "file_id": "..."}]
+    :param rate: темп рассылки, сообщений в секунду (если не передан `limiter`)
+    :param concurrency: число одновременных отправок
+    :param limiter: собственный лимитер рассылки вместо `rate` (см. JobLimiter)
+    :param on_start: колбэк начала отправки получателю (см. deliver)
+    :param on_result: колбэк с итогом по каждому получателю (см. deliver)
+    :param on_unreachable: колбэк для заблокировавших бота / удалённых (см. deliver)
+    """
+    payload = compile_payload(
+        bot,
+        caption=caption,
+        caption_entities=caption_entities,
+        file_ids=file_ids,
+    )
+
+    async def send(uid: int) -> None:
+        await bot(payload.for_chat(uid))
+
+    return await deliver(
+        tg_ids,
+        send,
+        limiter=limiter or TokenBucket(rate),
+        concurrency=concurrency,
+        # альбом из N файлов Telegram считает как N сообщений
+        cost=payload.cost,
+        on_start=on_start,
+        on_result=on_result,
+        on_unreachable=on_unreachable,
+    )
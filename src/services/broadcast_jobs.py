@@ -0,0 +1,419 @@
+# services/broadcast_jobs.py
+
+import asyncio
+import datetime as dt
+import logging
+from typing import AsyncIterator
+
+from aiogram import Bot
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from ..db import async_session
+from ..models import BroadcastJob, BroadcastDelivery
+from .audience import AudienceFilter, iter_recipient_pages, count_recipients
+from .broadcast import broadcast, DEFAULT_RATE, DEFAULT_CONCURRENCY
+from .broadcast_progress import ProgressReporter
+from .reachability import UnreachableMarker
+from .outbound import Priority, outbound_priority
+from .ratelimit import JobLimiter
+from .leader import AdvisoryLock, BROADCAST_JOB
+
+logger = logging.getLogger(__name__)
+
+# сколько получателей берём в работу за один запрос к БД;
+# при падении процесса без корректной остановки исход неизвестен максимум
+# для одной пачки и содержимого очереди отправки
+CLAIM_BATCH = 50
+# сколько итогов копим перед записью в журнал доставки
+FLUSH_BATCH = 200
+
+# выполняющиеся в этом процессе рассылки: job_id -> задача
+_tasks: dict[int, asyncio.Task] = {}
+# задания, остановленные администратором (в отличие от остановки процесса)
+_cancel_requested: set[int] = set()
+# не даёт периодическому resume_jobs запускаться поверх предыдущего
+_resume_lock = asyncio.Lock()
+
+
+async def create_job(
+    created_by: int,
+    *,
+    caption: str = "",
+    caption_entities: str | None = None,
+    file_ids: str | None = None,
+    audience: AudienceFilter | None = None,
+    scheduled_at: dt.datetime | None = None,
+    window_seconds: int | None = None,
+    max_rate: float | None = None,
+    progress_chat_id: int | None = None,
+    progress_message_id: int | None = None,
+    status: str = "running",
+) -> int:
+    """
+    Сохраняет рассылку как задание и возвращает его id.
+    Контент — в формате services.broadcast.broadcast; audience — кому слать
+    (по умолчанию всем); progress_* — сообщение, в котором показывается ход рассылки.
+    Отложенная рассылка создаётся со status="scheduled" и запускается
+    через activate_job; window_seconds и max_rate ограничивают её темп.
+    """
+    async with async_session() as sess:
+        job = BroadcastJob(
+            created_by=created_by,
+            caption=caption,
+            caption_entities=caption_entities,
+            file_ids=file_ids,
+            audience=audience.to_json() if audience else None,
+            status=status,
+            scheduled_at=scheduled_at,
+            window_seconds=window_seconds,
+            max_rate=max_rate,
+            progress_chat_id=progress_chat_id,
+            progress_message_id=progress_message_id,
+        )
+        sess.add(job)
+        await sess.commit()
+    logger.info("Created broadcast job #%s by %s", job.id, created_by)
+    return job.id
+
+
+async def activate_job(job_id: int) -> bool:
+    """
+    Переводит отложенное задание в running. Условный UPDATE — запустит
+    только один вызов; False, если задание отменено или уже запущено.
+    """
+    async with async_session() as sess:
+        result = await sess.execute(
+            update(BroadcastJob)
+            .where(BroadcastJob.id == job_id, BroadcastJob.status == "scheduled")
+            .values(status="running")
+        )
+        await sess.commit()
+    return result.rowcount > 0
+
+
+def job_rate(job: BroadcastJob, remaining: int, now: dt.datetime) -> float | None:
+    """
+    Собственный темп задания, сообщений/с: max_rate и/или равномерное
+    распределение оставшихся получателей до конца окна доставки
+    (после рестарта темп пересчитывается на остаток окна). None — без ограничения.
+    """
+    rates = []
+    if job.max_rate:
+        rates.append(job.max_rate)
+    if job.window_seconds:
+        window_end = (job.scheduled_at or job.created_at) + dt.timedelta(seconds=job.window_seconds)
+        left = (window_end - now).total_seconds()
+        if left > 0:
+            # не медленнее сообщения в минуту — иначе окно ничего не ускорит
+            rates.append(max(remaining / left, 1 / 60))
+    return min(rates) if rates else None
+
+
+class _JobRun:
+    """
+    Состояние одного запуска задания.
+    Получатели (по фильтру аудитории задания) берутся в работу пачками
+    по возрастанию telegram_id: строки пачки
+    пишутся в журнал со статусом pending, а курсор задания сдвигается — в одной
+    транзакции. Итоги отправки копятся в буфере и пишутся в журнал пачками
+    вместе со счётчиками задания.
+    """
+
+    def __init__(self, job_id: int, cursor: int, audience: AudienceFilter):
+        self.job_id = job_id
+        self.cursor = cursor
+        self.audience = audience
+        # задание отменили из другого процесса (кнопка «Стоп» попала не сюда)
+        self.cancelled = False
+        # взяты в работу, но воркер ещё не начал отправку (порядок = порядок очереди)
+        self._unstarted: dict[int, None] = {}
+        self._rows: list[dict] = []
+        self._lock = asyncio.Lock()
+
+    async def recipients(self) -> AsyncIterator[int]:
+        async for ids in iter_recipient_pages(self.audience, after=self.cursor, page_size=CLAIM_BATCH):
+            async with async_session() as sess:
+                await sess.execute(
+                    pg_insert(BroadcastDelivery).on_conflict_do_nothing(),
+                    [{"job_id": self.job_id, "telegram_id": uid, "status": "pending"} for uid in ids],
+                )
+                claimed = await sess.execute(
+                    update(BroadcastJob)
+                    .where(BroadcastJob.id == self.job_id, BroadcastJob.status == "running")
+                    .values(last_telegram_id=ids[-1])
+                )
+                if claimed.rowcount == 0:
+                    await sess.rollback()
+                    self.cancelled = True
+                    logger.info("Broadcast job #%s was cancelled elsewhere", self.job_id)
+                    return
+                await sess.commit()
+            self.cursor = ids[-1]
+            self._unstarted.update(dict.fromkeys(ids))
+            for uid in ids:
+                yield uid
+
+    def started(self, uid: int) -> None:
+        self._unstarted.pop(uid, None)
+
+    async def add(self, uid: int, error: str | None) -> None:
+        self._rows.append({
+            "job_id": self.job_id,
+            "telegram_id": uid,
+            "status": "sent" if error is None else "failed",
+            "error": error[:255] if error else None,
+        })
+        if len(self._rows) >= FLUSH_BATCH:
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            rows, self._rows = self._rows, []
+            if not rows:
+                return
+            sent = sum(1 for r in rows if r["status"] == "sent")
+            async with async_session() as sess:
+                await sess.execute(update(BroadcastDelivery), rows)
+                await sess.execute(
+                    update(BroadcastJob)
+                    .where(BroadcastJob.id == self.job_id)
+                    .values(
+                        sent=BroadcastJob.sent + sent,
+                        failed=BroadcastJob.failed + (len(rows) - sent),
+                    )
+                )
+                await sess.commit()
+
+    async def release(self) -> None:
+        """
+        При остановке возвращает в очередь получателей, до которых воркеры
+        не дошли: они идут хвостом по возрастанию id, поэтому достаточно
+        удалить их строки и откатить курсор.
+        """
+        if not self._unstarted:
+            return
+        ids = list(self._unstarted)
+        async with async_session() as sess:
+            await sess.execute(
+                delete(BroadcastDelivery).where(
+                    BroadcastDelivery.job_id == self.job_id,
+                    BroadcastDelivery.telegram_id.in_(ids),
+                )
+            )
+            await sess.execute(
+                update(BroadcastJob)
+                .where(BroadcastJob.id == self.job_id)
+                .values(last_telegram_id=min(ids) - 1)
+            )
+            await sess.commit()
+        self._unstarted.clear()
+
+
+async def run_job(
+    bot: Bot,
+    job_id: int,
+    *,
+    rate: float = DEFAULT_RATE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> tuple[int, int] | None:
+    """
+    Выполняет (или продолжает после рестарта) задание рассылки.
+    Получатели, взятые в работу прошлым процессом, но без записанного итога,
+    помечаются unknown и повторно не получают сообщение.
+    Если у задания есть сообщение о прогрессе — периодически обновляет его.
+    Задание выполняет только процесс, удерживающий его advisory lock;
+    если оно уже выполняется в другом процессе, возвращает None.
+    :return: (отправлено, ошибок) по заданию целиком
+    """
+    try:
+        lock = AdvisoryLock(BROADCAST_JOB, job_id)
+        if not await lock.try_acquire():
+            logger.info("Broadcast job #%s is running in another process", job_id)
+            return None
+        try:
+            # все отправки задания (и задачи, которые оно создаёт) — в хвосте общей очереди
+            with outbound_priority(Priority.BROADCAST):
+                return await _run_locked(bot, job_id, rate=rate, concurrency=concurrency)
+        finally:
+            await lock.release()
+    finally:
+        # остановка могла прийти на любом шаге, в том числе до начала отправки
+        _cancel_requested.discard(job_id)
+
+
+async def _run_locked(bot: Bot, job_id: int, *, rate: float, concurrency: int) -> tuple[int, int]:
+    async with async_session() as sess:
+        job = await sess.get(BroadcastJob, job_id)
+        if job is None or job.status != "running":
+            # отменено (или завершено) до того, как задача успела начать
+            logger.info("Broadcast job #%s is no longer running, skipping", job_id)
+            return None
+        await sess.execute(
+            update(BroadcastDelivery)
+            .where(BroadcastDelivery.job_id == job_id, BroadcastDelivery.status == "pending")
+            .values(status="unknown")
+        )
+        unknown = await sess.scalar(
+            select(func.count())
+            .select_from(BroadcastDelivery)
+            .where(BroadcastDelivery.job_id == job_id, BroadcastDelivery.status == "unknown")
+        )
+        await sess.commit()
+
+    audience = AudienceFilter.from_json(job.audience)
+    remaining = await count_recipients(audience, after=job.last_telegram_id)
+
+    logger.info("Running broadcast job #%s from telegram_id > %s", job_id, job.last_telegram_id)
+    own_rate = job_rate(job, remaining, dt.datetime.utcnow())
+    if own_rate is not None and own_rate < rate:
+        rate = own_rate
+        logger.info("Broadcast job #%s is paced at %.2f msg/s", job_id, own_rate)
+    limiter = JobLimiter(rate)
+    run = _JobRun(job_id, job.last_telegram_id, audience)
+    unreachable = UnreachableMarker()
+    progress = None
+    if job.progress_message_id is not None:
+        progress = ProgressReporter(
+            bot,
+            job_id,
+            job.progress_chat_id,
+            job.progress_message_id,
+            total=job.sent + job.failed + unknown + remaining,
+            sent=job.sent,
+            failed=job.failed,
+        )
+        progress.start()
+
+    async def on_result(uid: int, error: str | None) -> None:
+        if progress is not None:
+            progress.record(error)
+        await run.add(uid, error)
+
+    status = "done"
+    try:
+        await broadcast(
+            bot=bot,
+            tg_ids=run.recipients(),
+            caption=job.caption,
+            caption_entities=job.caption_entities,
+            file_ids=job.file_ids,
+            limiter=limiter,
+            concurrency=concurrency,
+            on_start=run.started,
+            on_result=on_result,
+            on_unreachable=unreachable.add,
+        )
+    except asyncio.CancelledError:
+        if job_id not in _cancel_requested:
+            # остановка процесса: задание остаётся running и продолжится после рестарта
+            raise
+        status = "cancelled"
+    finally:
+        if progress is not None:
+            progress.stop()
+        await run.flush()
+        await run.release()
+        await unreachable.flush()
+
+    if run.cancelled:
+        status = "cancelled"
+    async with async_session() as sess:
+        job = await sess.get(BroadcastJob, job_id)
+        if job.status == "running":
+            job.status = status
+            job.finished_at = dt.datetime.utcnow()
+        await sess.commit()
+    logger.info("Broadcast job #%s %s: sent=%s, failed=%s", job_id, status, job.sent, job.failed)
+
+    if progress is not None:
+        title = "завершена" if status == "done" else "остановлена"
+        await progress.finish(f"Рассылка #{job_id} {title}.")
+    return job.sent, job.failed
+
+
+def start_job(
+    bot: Bot,
+    job_id: int,
+    *,
+    rate: float = DEFAULT_RATE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> asyncio.Task:
+    """
+    Запускает задание фоновой задачей и регистрирует её для остановки кнопкой.
+    """
+    task = asyncio.create_task(
+        run_job(bot, job_id, rate=rate, concurrency=concurrency),
+        name=f"broadcast-{job_id}",
+    )
+    _tasks[job_id] = task
+
+    def _done(t: asyncio.Task) -> None:
+        _tasks.pop(job_id, None)
+        if not t.cancelled() and t.exception() is not None:
+            logger.error("Broadcast job #%s crashed", job_id, exc_info=t.exception())
+
+    task.add_done_callback(_done)
+    return task
+
+
+async def cancel_job(job_id: int) -> str | None:
+    """
+    Останавливает рассылку: сначала помечает задание отменённым в БД — так
+    отмена не теряется, даже если задача ещё запускается или процесс упадёт, —
+    затем прерывает задачу, если она выполняется в этом процессе. Задание,
+    которое выполняет другой процесс, остановится на следующей пачке.
+    :return: статус задания до отмены (running / scheduled) или None,
+        если задание уже не активно
+    """
+    async with async_session() as sess:
+        previous = await sess.scalar(
+            select(BroadcastJob.status)
+            .where(BroadcastJob.id == job_id, BroadcastJob.status.in_(("running", "scheduled")))
+            .with_for_update()
+        )
+        if previous is not None:
+            await sess.execute(
+                update(BroadcastJob)
+                .where(BroadcastJob.id == job_id)
+                .values(status="cancelled", finished_at=dt.datetime.utcnow())
+            )
+        await sess.commit()
+
+    task = _tasks.get(job_id)
+    if previous is not None and task is not None:
+        _cancel_requested.add(job_id)
+        task.cancel()
+    return previous
+
+
+async def resume_jobs(
+    bot: Bot,
+    *,
+    rate: float = DEFAULT_RATE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> None:
+    """
+    Продолжает рассылки, прерванные рестартом или падением процесса: все
+    сразу, фоновыми задачами. Задания, которые выполняет живой процесс,
+    пропускаются (их advisory lock занят), поэтому вызывать можно
+    периодически и из любого процесса.
+    Прогресс продолжает обновляться в исходном сообщении администратору.
+    """
+    if _resume_lock.locked():
+        return
+    async with _resume_lock:
+        async with async_session() as sess:
+            result = await sess.execute(
+                select(BroadcastJob.id)
+                .where(BroadcastJob.status == "running")
+                .order_by(BroadcastJob.id)
+            )
+            job_ids = result.scalars().all()
+
+        for job_id in job_ids:
+            if job_id in _tasks:
+                continue
+            logger.info("Resuming broadcast job #%s", job_id)
+            # не ждём: долгая рассылка не должна задерживать остальные
+            start_job(bot, job_id, rate=rate, concurrency=concurrency)
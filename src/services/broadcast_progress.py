@@ -0,0 +1,123 @@
+# services/broadcast_progress.py
+
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from .outbound import Priority, outbound_priority
+
+logger = logging.getLogger(__name__)
+
+# не чаще одного редактирования сообщения о прогрессе за столько секунд
+PROGRESS_INTERVAL = 5.0
+
+
+def stop_keyboard(job_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text="⛔ Остановить", callback_data=f"broadcast_stop:{job_id}")]]
+    )
+
+
+def format_eta(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours} ч {minutes} мин"
+    if minutes:
+        return f"{minutes} мин {seconds} с"
+    return f"{seconds} с"
+
+
+class ProgressReporter:
+    """
+    Периодически редактирует одно сообщение администратору:
+    отправлено / ошибок / осталось, скорость и ETA.
+    Редактирования идут через общую очередь исходящих сообщений
+    с приоритетом выше рассылки — прогресс не стоит за её отправками.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        job_id: int,
+        chat_id: int,
+        message_id: int,
+        *,
+        total: int,
+        sent: int = 0,
+        failed: int = 0,
+    ):
+        self.bot = bot
+        self.job_id = job_id
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.total = total
+        self.sent = sent
+        self.failed = failed
+        self._started = time.monotonic()
+        self._done_at_start = sent + failed
+        self._last_text = ""
+        self._task: asyncio.Task | None = None
+
+    def record(self, error: str | None) -> None:
+        if error is None:
+            self.sent += 1
+        else:
+            self.failed += 1
+
+    def render(self) -> str:
+        done = self.sent + self.failed
+        remaining = max(self.total - done, 0)
+        elapsed = time.monotonic() - self._started
+        speed = (done - self._done_at_start) / elapsed if elapsed > 0 else 0.0
+        lines = [
+            f"📨 Рассылка #{self.job_id}",
+            f"✅ Отправлено: {self.sent}",
+            f"❌ Ошибок: {self.failed}",
+            f"⏳ Осталось: {remaining}",
+        ]
+        if speed > 0:
+            lines.append(f"⚡ {speed:.1f} сообщ./с, ETA ≈ {format_eta(remaining / speed)}")
+        return "\n".join(lines)
+
+    async def _edit(self, text: str, with_button: bool) -> None:
+        if text == self._last_text:
+            return
+        try:
+            with outbound_priority(Priority.REMINDER):
+                await self.bot.edit_message_text(
+                    text=text,
+                    chat_id=self.chat_id,
+                    message_id=self.message_id,
+                    reply_markup=stop_keyboard(self.job_id) if with_button else None,
+                )
+            self._last_text = text
+        except TelegramAPIError as e:
+            logger.warning("Failed to update progress of broadcast #%s: %s", self.job_id, e)
+
+    async def _loop(self) -> None:
+        while True:
+            await self._edit(self.render(), with_button=True)
+            await asyncio.sleep(PROGRESS_INTERVAL)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._loop())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def finish(self, title: str) -> None:
+        """
+        Останавливает периодические обновления и пишет итог без кнопки.
+        """
+        self.stop()
+        await self._edit(
+            f"{title}\n✅ Отправлено: {self.sent}\n❌ Ошибок: {self.failed}",
+            with_button=False,
+        )
@@ -0,0 +1,135 @@
+# services/export.py
+
+import asyncio
+import csv
+import gzip
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, Sequence
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.pool import NullPool
+
+from ..config import settings
+from ..models import User
+
+logger = logging.getLogger(__name__)
+
+# сколько строк за раз забираем из серверного курсора Postgres
+BATCH_SIZE = 2000
+
+COLUMNS = (
+    ("ID Telegram", User.telegram_id),
+    ("Имя пользователя", User.username),
+    ("ФИО", User.fio),
+    ("Специализация", User.specialization),
+    ("Email", User.email),
+    ("Дата регистрации (UTC)", User.registered_at),
+)
+
+FORMATS = {
+    "xlsx": ".xlsx",
+    "csv": ".csv.gz",
+}
+
+# один долгоживущий процесс на все выгрузки: запуск через spawn под
+# `python -m src.bot` заново импортирует бота (aiogram, хендлеры) — секунды
+_pool: ProcessPoolExecutor | None = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, а не fork: процесс бота многопоточный
+        _pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _warm_up() -> None:
+    pass
+
+
+async def start_export_pool() -> None:
+    """Поднимает процесс выгрузки заранее (при старте бота), а не на первом /export."""
+    await asyncio.get_running_loop().run_in_executor(_get_pool(), _warm_up)
+
+
+def shutdown_export_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _write_xlsx(path: str, rows: Iterator[Sequence]) -> None:
+    # openpyxl импортируем лениво: он нужен только экспорту
+    from openpyxl import Workbook
+
+    # write-only книга не держит строки в памяти, а сразу пишет их в файл
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Пользователи")
+    ws.append([title for title, _ in COLUMNS])
+    for row in rows:
+        ws.append(list(row))
+    wb.save(path)
+
+
+def _write_csv(path: str, rows: Iterator[Sequence]) -> None:
+    # utf-8-sig — чтобы Excel правильно открыл кириллицу
+    with gzip.open(path, "wt", encoding="utf-8-sig", newline="") as fp:
+        writer = csv.writer(fp, delimiter=";")
+        writer.writerow([title for title, _ in COLUMNS])
+        writer.writerows(rows)
+
+
+def _export_sync(path: str, fmt: str) -> int:
+    """
+    Выполняется в отдельном процессе: читает пользователей серверным
+    курсором (по BATCH_SIZE строк) и сразу пишет их в файл.
+    """
+    writer = {"xlsx": _write_xlsx, "csv": _write_csv}[fmt]
+    engine = create_engine(
+        str(settings.database_url).replace("+asyncpg", "+psycopg2"),
+        poolclass=NullPool,
+        connect_args={"client_encoding": "utf8"},
+    )
+    total = 0
+
+    def counted(rows):
+        nonlocal total
+        for row in rows:
+            total += 1
+            yield row
+
+    try:
+        with engine.connect() as conn:
+            result = conn.execution_options(yield_per=BATCH_SIZE).execute(
+                select(*(column for _, column in COLUMNS)).order_by(User.telegram_id)
+            )
+            writer(path, counted(result))
+    finally:
+        engine.dispose()
+    return total
+
+
+async def export_users(path: str, fmt: str = "xlsx") -> int:
+    """
+    Выгружает пользователей в файл `path` в формате `fmt` (см. FORMATS).
+    Вся работа идёт в отдельном процессе (общем для всех выгрузок): запись
+    xlsx — чистый CPU и в потоке отнимала бы GIL у event loop. Память
+    ограничена размером пачки, а не таблицы. Возвращает число выгруженных строк.
+    """
+    global _pool
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown export format: {fmt}")
+    loop = asyncio.get_running_loop()
+    try:
+        total = await loop.run_in_executor(_get_pool(), _export_sync, path, fmt)
+    except BrokenProcessPool:
+        # процесс выгрузки упал — следующая выгрузка поднимет новый
+        _pool = None
+        raise
+    logger.info("Exported %d users to %s", total, path)
+    return total
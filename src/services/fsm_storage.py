@@ -0,0 +1,84 @@
+# services/fsm_storage.py
+
+import datetime as dt
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+from sqlalchemy import select, delete, literal
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from ..db import async_session
+from ..models import FsmState
+
+
+def _key(key: StorageKey) -> str:
+    return ":".join(
+        str(part) if part is not None else ""
+        for part in (
+            key.bot_id, key.business_connection_id, key.chat_id,
+            key.thread_id, key.user_id, key.destiny,
+        )
+    )
+
+
+class PostgresStorage(BaseStorage):
+    """
+    FSM-хранилище в Postgres: состояние администратора (например, сбор
+    рассылки) видно любому процессу бота, которому придёт следующий апдейт.
+    Данные хранятся в JSONB, поэтому в них можно класть только JSON-значения.
+    """
+
+    def _upsert(self, key: StorageKey, values: dict[str, Any]):
+        now = dt.datetime.utcnow()
+        row = {"key": _key(key), "state": None, "data": {}, "updated_at": now, **values}
+        stmt = pg_insert(FsmState).values(**row)
+        return stmt.on_conflict_do_update(
+            index_elements=[FsmState.key],
+            set_={**values, "updated_at": now},
+        )
+
+    async def _execute_and_prune(self, key: StorageKey, stmt) -> None:
+        async with async_session() as sess:
+            await sess.execute(stmt)
+            # пустые записи не храним
+            await sess.execute(
+                delete(FsmState).where(
+                    FsmState.key == _key(key),
+                    FsmState.state.is_(None),
+                    FsmState.data == literal({}, FsmState.data.type),
+                )
+            )
+            await sess.commit()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._execute_and_prune(key, self._upsert(key, {"state": value}))
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        async with async_session() as sess:
+            return await sess.scalar(select(FsmState.state).where(FsmState.key == _key(key)))
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        await self._execute_and_prune(key, self._upsert(key, {"data": data}))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        async with async_session() as sess:
+            data = await sess.scalar(select(FsmState.data).where(FsmState.key == _key(key)))
+        return dict(data or {})
+
+    async def update_data(self, key: StorageKey, data: dict[str, Any]) -> dict[str, Any]:
+        # слияние на стороне Postgres (jsonb || jsonb) — атомарно для параллельных процессов
+        now = dt.datetime.utcnow()
+        stmt = pg_insert(FsmState).values(key=_key(key), data=data, updated_at=now)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[FsmState.key],
+            set_={"data": FsmState.data.concat(stmt.excluded.data), "updated_at": now},
+        ).returning(FsmState.data)
+        async with async_session() as sess:
+            merged = await sess.scalar(stmt)
+            await sess.commit()
+        return dict(merged)
+
+    async def close(self) -> None:
+        pass
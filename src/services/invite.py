@@ -1,5 +1,16 @@
+import logging
+
 from aiogram import Bot
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
 from src.config import settings
+from src.db import async_session
+from src.models import InviteLink
+from src.services.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
 
 async def create_one_time_invite(bot: Bot) -> str:
     res = await bot.create_chat_invite_link(
@@ -8,3 +19,55 @@ async def create_one_time_invite(bot: Bot) -> str:
         creates_join_request=False
     )
     return res.invite_link
+
+
+async def checkout_invite(bot: Bot) -> str:
+    """
+    Выдаёт ссылку из пула заранее созданных. Строка забирается атомарно
+    (FOR UPDATE SKIP LOCKED + DELETE), поэтому бот и webapp, даже в нескольких
+    копиях, никогда не выдадут одну ссылку дважды.
+    Если пул пуст — создаёт ссылку напрямую.
+    """
+    oldest = (
+        select(InviteLink.id)
+        .order_by(InviteLink.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    async with async_session() as sess:
+        link = await sess.scalar(
+            delete(InviteLink).where(InviteLink.id == oldest).returning(InviteLink.link)
+        )
+        await sess.commit()
+
+    if link is None:
+        logger.warning("Invite pool is empty, creating link on request path")
+        link = await create_one_time_invite(bot)
+    return link
+
+
+async def refill_invite_pool(bot: Bot) -> int:
+    """
+    Пополняет пул до invite_pool_size, если в нём осталось меньше
+    invite_pool_low_water ссылок. Ссылки создаются не быстрее
+    invite_pool_refill_rate в секунду, чтобы не упираться в лимиты Telegram.
+    Возвращает число созданных ссылок.
+    """
+    async with async_session() as sess:
+        available = await sess.scalar(select(func.count()).select_from(InviteLink))
+    if available >= settings.invite_pool_low_water:
+        return 0
+
+    limiter = TokenBucket(settings.invite_pool_refill_rate, capacity=1)
+    created = 0
+    for _ in range(settings.invite_pool_size - available):
+        await limiter.acquire()
+        link = await create_one_time_invite(bot)
+        async with async_session() as sess:
+            await sess.execute(pg_insert(InviteLink).values(link=link).on_conflict_do_nothing())
+            await sess.commit()
+        created += 1
+
+    logger.info("Invite pool refilled: %d -> %d", available, available + created)
+    return created
@@ -0,0 +1,101 @@
+# services/leader.py
+
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+import asyncpg
+
+from ..db import asyncpg_dsn
+
+logger = logging.getLogger(__name__)
+
+# пространства ключей advisory lock'ов (первый аргумент pg_advisory_lock(int, int))
+SCHEDULER_LEADER = 1
+BROADCAST_JOB = 2
+# как часто не-лидер пробует занять лидерство
+RETRY_INTERVAL = 15.0
+
+
+class AdvisoryLock:
+    """
+    Сессионный advisory lock Postgres на отдельном соединении. Блокировка
+    держится, пока открыто соединение: если процесс упал или потерял связь
+    с БД, её автоматически получает другой процесс.
+    """
+
+    def __init__(self, namespace: int, key: int):
+        self.namespace = namespace
+        self.key = key
+        self.lost = asyncio.Event()
+        self._conn: asyncpg.Connection | None = None
+
+    async def try_acquire(self) -> bool:
+        conn = await asyncpg.connect(asyncpg_dsn())
+        try:
+            acquired = await conn.fetchval(
+                "SELECT pg_try_advisory_lock($1, $2)", self.namespace, self.key
+            )
+        except BaseException:
+            await conn.close()
+            raise
+        if not acquired:
+            await conn.close()
+            return False
+        self.lost.clear()
+        conn.add_termination_listener(lambda c: self.lost.set())
+        self._conn = conn
+        return True
+
+    async def release(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None and not conn.is_closed():
+            # закрытие соединения снимает блокировку
+            await conn.close()
+
+
+async def run_as_leader(
+    name: str,
+    lock: AdvisoryLock,
+    on_elected: Callable[[], Awaitable[None]],
+    on_demoted: Callable[[], Awaitable[None]] | None = None,
+) -> None:
+    """
+    Выборы лидера среди процессов бота: кто взял блокировку, тот выполняет
+    on_elected и остаётся лидером, пока жива его сессия в Postgres.
+    Остальные периодически пробуют занять место. Если on_elected упал,
+    лидер снимает блокировку, выполняет on_demoted и через RETRY_INTERVAL
+    участвует в выборах заново.
+    """
+    while True:
+        try:
+            elected = await lock.try_acquire()
+        except Exception as e:
+            logger.warning("%s: leader election failed: %r", name, e)
+            elected = False
+
+        if elected:
+            logger.info("%s: this process is the leader", name)
+            try:
+                await on_elected()
+                await lock.lost.wait()
+                logger.warning("%s: leadership lost", name)
+            except Exception:
+                # временная ошибка (например, БД при сверке задач) не должна
+                # навсегда оставить процессы без лидера — уступаем и пробуем снова
+                logger.exception("%s: leader failed, stepping down", name)
+            finally:
+                await lock.release()
+            if on_demoted is not None:
+                try:
+                    await on_demoted()
+                except Exception:
+                    logger.exception("%s: failed to step down cleanly", name)
+
+        await asyncio.sleep(RETRY_INTERVAL)
+
+
+def log_task_failure(task: asyncio.Task) -> None:
+    """done_callback для фоновых задач: исключение не должно пропасть молча."""
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background task %s failed", task.get_name(), exc_info=task.exception())
@@ -0,0 +1,136 @@
+# services/media_groups.py
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from sqlalchemy import select, delete, func, distinct
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from ..db import async_session
+from ..models import MediaGroupPart
+
+logger = logging.getLogger(__name__)
+
+# альбом считается полученным, если новых частей не было столько секунд
+DEBOUNCE = 1.5
+
+
+@dataclass(frozen=True)
+class MediaGroup:
+    media_group_id: str
+    chat_id: int
+    user_id: int
+    caption: str
+    caption_entities: list | None
+    files: list[dict]
+
+
+# альбомы, которые ждёт этот процесс
+_waiting: set[str] = set()
+
+
+async def add_part(
+    media_group_id: str,
+    *,
+    message_id: int,
+    chat_id: int,
+    user_id: int,
+    caption: str | None,
+    caption_entities: list | None,
+    file: dict | None,
+) -> None:
+    """Сохраняет часть альбома; повторная доставка того же апдейта ничего не меняет."""
+    async with async_session() as sess:
+        await sess.execute(
+            pg_insert(MediaGroupPart).values(
+                media_group_id=media_group_id,
+                message_id=message_id,
+                chat_id=chat_id,
+                user_id=user_id,
+                caption=caption,
+                caption_entities=caption_entities,
+                file=file,
+            ).on_conflict_do_nothing()
+        )
+        await sess.commit()
+
+
+async def _quiet_for(media_group_id: str) -> float | None:
+    """Сколько секунд альбом не получал новых частей; None — альбома уже нет."""
+    async with async_session() as sess:
+        return await sess.scalar(
+            select(func.extract("epoch", func.localtimestamp() - func.max(MediaGroupPart.received_at)))
+            .where(MediaGroupPart.media_group_id == media_group_id)
+        )
+
+
+async def flush(media_group_id: str) -> MediaGroup | None:
+    """
+    Забирает все части альбома одним DELETE ... RETURNING: при нескольких
+    процессах альбом достаётся ровно одному из них.
+    """
+    async with async_session() as sess:
+        result = await sess.execute(
+            delete(MediaGroupPart)
+            .where(MediaGroupPart.media_group_id == media_group_id)
+            .returning(
+                MediaGroupPart.message_id,
+                MediaGroupPart.chat_id,
+                MediaGroupPart.user_id,
+                MediaGroupPart.caption,
+                MediaGroupPart.caption_entities,
+                MediaGroupPart.file,
+            )
+        )
+        parts = sorted(result.all(), key=lambda p: p.message_id)
+        await sess.commit()
+    if not parts:
+        return None
+
+    first = parts[0]
+    return MediaGroup(
+        media_group_id=media_group_id,
+        chat_id=first.chat_id,
+        user_id=first.user_id,
+        caption=first.caption or "",
+        caption_entities=first.caption_entities,
+        files=[p.file for p in parts if p.file],
+    )
+
+
+async def _wait_and_flush(media_group_id: str, on_ready: Callable[[MediaGroup], Awaitable[None]]) -> None:
+    try:
+        # каждая новая часть отодвигает сборку альбома ещё на DEBOUNCE
+        while (quiet := await _quiet_for(media_group_id)) is not None:
+            if quiet < DEBOUNCE:
+                await asyncio.sleep(DEBOUNCE - float(quiet))
+                continue
+            group = await flush(media_group_id)
+            if group is not None:
+                logger.debug("Media group %s collected: %d files", media_group_id, len(group.files))
+                await on_ready(group)
+            return
+    except Exception:
+        logger.exception("Failed to collect media group %s", media_group_id)
+    finally:
+        _waiting.discard(media_group_id)
+
+
+def schedule_flush(media_group_id: str, on_ready: Callable[[MediaGroup], Awaitable[None]]) -> None:
+    """
+    Запускает (если ещё не запущено в этом процессе) ожидание конца альбома;
+    когда части перестают приходить, вызывает on_ready с собранным альбомом.
+    """
+    if media_group_id in _waiting:
+        return
+    _waiting.add(media_group_id)
+    asyncio.create_task(_wait_and_flush(media_group_id, on_ready))
+
+
+async def pending_groups() -> list[str]:
+    """Альбомы, не собранные до рестарта процесса."""
+    async with async_session() as sess:
+        result = await sess.execute(select(distinct(MediaGroupPart.media_group_id)))
+        return list(result.scalars())
@@ -0,0 +1,252 @@
+# services/outbound.py
+
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    Response, TelegramMethod,
+    SendMessage, SendPhoto, SendDocument, SendVideo, SendAnimation, SendAudio,
+    SendVoice, SendVideoNote, SendSticker, SendLocation, SendVenue, SendContact,
+    SendPoll, SendDice, SendGame, SendInvoice, SendMediaGroup,
+    CopyMessage, CopyMessages, ForwardMessage, ForwardMessages,
+    EditMessageText, EditMessageCaption, EditMessageMedia,
+)
+from aiogram.methods.base import TelegramType
+
+logger = logging.getLogger(__name__)
+
+# сколько последних замеров храним для перцентилей
+LATENCY_SAMPLES = 1000
+
+# запросы, которые Telegram засчитывает в лимит сообщений; служебные
+# (sendChatAction, editMessageReplyMarkup, getUpdates, ответы на callback,
+# ссылки-приглашения и т. п.) под него не попадают
+MESSAGE_METHODS = (
+    SendMessage, SendPhoto, SendDocument, SendVideo, SendAnimation, SendAudio,
+    SendVoice, SendVideoNote, SendSticker, SendLocation, SendVenue, SendContact,
+    SendPoll, SendDice, SendGame, SendInvoice,
+    CopyMessage, ForwardMessage,
+    EditMessageText, EditMessageCaption, EditMessageMedia,
+)
+
+
+class Priority(IntEnum):
+    """Приоритет исходящих запросов к Bot API: меньше — важнее."""
+    INTERACTIVE = 0   # ответы пользователям и администраторам
+    REMINDER = 1      # напоминания, фоновые служебные отправки
+    BROADCAST = 2     # рассылки
+
+
+_priority: ContextVar[Priority] = ContextVar("outbound_priority", default=Priority.INTERACTIVE)
+
+
+@contextmanager
+def outbound_priority(priority: Priority):
+    """
+    Все запросы к Bot API внутри блока (и в задачах, созданных в нём)
+    идут с этим приоритетом. По умолчанию — INTERACTIVE.
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class LatencyStats:
+    """Ожидание в очереди и полное время запроса для одного приоритета."""
+
+    def __init__(self):
+        self.requests = 0
+        self.waited = 0               # сколько запросов ждали бюджета
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._waits: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self._totals: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    def record(self, wait: float, total: float) -> None:
+        self.requests += 1
+        if wait > 0:
+            self.waited += 1
+            self.wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+        self._waits.append(wait)
+        self._totals.append(total)
+
+    @staticmethod
+    def _percentile(samples: deque[float], q: float) -> float | None:
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return round(ordered[min(int(len(ordered) * q), len(ordered) - 1)], 4)
+
+    def snapshot(self) -> dict:
+        return {
+            "requests": self.requests,
+            "waited": self.waited,
+            "wait_seconds": round(self.wait_seconds, 3),
+            "max_wait_seconds": round(self.max_wait_seconds, 3),
+            "wait_p50": self._percentile(self._waits, 0.5),
+            "wait_p95": self._percentile(self._waits, 0.95),
+            "latency_p50": self._percentile(self._totals, 0.5),
+            "latency_p95": self._percentile(self._totals, 0.95),
+        }
+
+
+class PriorityLimiter:
+    """
+    Общий на процесс бюджет сообщений к Telegram (token bucket), который
+    выдаёт токены в порядке приоритета: пока ждёт ответ пользователю,
+    рассылка не получает ни одного токена; внутри приоритета — FIFO.
+    pause() останавливает выдачу всем (RetryAfter действует на весь бот).
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        # (приоритет, порядковый номер, токены, future)
+        self._waiters: list[tuple[int, int, float, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+
+    def _refill(self, now: float) -> None:
+        if now < self._paused_until:
+            return
+        elapsed = now - max(self._updated, self._paused_until)
+        self._updated = now
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+
+    def _drain(self) -> None:
+        """Выдаёт токены ожидающим по приоритету; если не хватает — заводит таймер."""
+        self._timer = None
+        now = time.monotonic()
+        self._refill(now)
+        while self._waiters:
+            _, _, tokens, fut = self._waiters[0]
+            if fut.done():
+                # ожидающий отменён
+                heapq.heappop(self._waiters)
+                continue
+            if now < self._paused_until:
+                delay = self._paused_until - now
+            elif self._tokens >= tokens:
+                heapq.heappop(self._waiters)
+                self._tokens -= tokens
+                fut.set_result(None)
+                continue
+            else:
+                delay = (tokens - self._tokens) / self.rate
+            self._timer = asyncio.get_running_loop().call_later(delay, self._drain)
+            return
+
+    async def acquire(self, priority: Priority, tokens: float = 1.0) -> float:
+        """Ждёт `tokens` токенов с приоритетом `priority`; возвращает время ожидания, с."""
+        tokens = min(tokens, self.capacity)
+        now = time.monotonic()
+        self._refill(now)
+        if not self._waiters and now >= self._paused_until and self._tokens >= tokens:
+            self._tokens -= tokens
+            return 0.0
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._seq), tokens, fut))
+        # новый ожидающий мог оказаться важнее того, под кого заведён таймер
+        if self._timer is not None:
+            self._timer.cancel()
+        self._drain()
+        await fut
+        return time.monotonic() - now
+
+    def pause(self, seconds: float) -> None:
+        """
+        Останавливает выдачу токенов на `seconds` секунд (по RetryAfter).
+        После паузы ведро наполняется с нуля, чтобы не выстрелить всплеском.
+        """
+        until = time.monotonic() + seconds
+        if until > self._paused_until:
+            self._paused_until = until
+            self._tokens = 0.0
+            if self._waiters:
+                if self._timer is not None:
+                    self._timer.cancel()
+                self._drain()
+
+    def queued(self) -> dict[str, int]:
+        counts = {p.name.lower(): 0 for p in Priority}
+        for priority, _, _, fut in self._waiters:
+            if not fut.done():
+                counts[Priority(priority).name.lower()] += 1
+        return counts
+
+
+def _message_cost(method: TelegramMethod) -> float:
+    """Сколько сообщений Telegram засчитает за запрос; 0 — запрос не лимитируется."""
+    if isinstance(method, SendMediaGroup):
+        media = method.media
+        # шаблон рассылки (compile_payload) хранит media уже сериализованным в JSON
+        if isinstance(media, str):
+            media = json.loads(media)
+        return float(len(media))
+    if isinstance(method, (CopyMessages, ForwardMessages)):
+        return float(len(method.message_ids))
+    if isinstance(method, MESSAGE_METHODS):
+        return 1.0
+    return 0.0
+
+
+class OutboundMiddleware(BaseRequestMiddleware):
+    """
+    Единая точка выхода к Bot API для всех отправителей процесса (хендлеры,
+    webapp, напоминания, рассылки): каждый запрос-сообщение ждёт токен
+    общего PriorityLimiter со своим приоритетом (см. outbound_priority),
+    RetryAfter ставит на паузу весь бюджет. Замеры — по приоритетам.
+    """
+
+    def __init__(self, limiter: PriorityLimiter):
+        self.limiter = limiter
+        self.stats = {priority: LatencyStats() for priority in Priority}
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        cost = _message_cost(method)
+        if not cost:
+            return await make_request(bot, method)
+
+        priority = _priority.get()
+        started = time.monotonic()
+        wait = await self.limiter.acquire(priority, cost)
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as e:
+            logger.info("RetryAfter %ss on %s, pausing outbound queue", e.retry_after, type(method).__name__)
+            self.limiter.pause(e.retry_after)
+            raise
+        finally:
+            self.stats[priority].record(wait, time.monotonic() - started)
+
+    def snapshot(self) -> dict:
+        return {
+            "rate": self.limiter.rate,
+            "queued": self.limiter.queued(),
+            **{priority.name.lower(): stats.snapshot() for priority, stats in self.stats.items()},
+        }
@@ -0,0 +1,157 @@
+# services/outbox.py
+
+import asyncio
+import datetime as dt
+import logging
+
+from aiogram import Bot
+from sqlalchemy import select, update, delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from ..config import settings
+from ..db import async_session
+from ..models import RegisterOutbox, User
+from .invite import checkout_invite
+from .user_cache import notify_user_changed
+
+logger = logging.getLogger(__name__)
+
+# сколько записей worker забирает за раз
+CLAIM_BATCH = 20
+# на сколько запись «арендуется» worker'ом; если он упал — её заберут снова
+LEASE = dt.timedelta(seconds=60)
+# как часто проверять outbox, если нас не разбудили
+POLL_INTERVAL = 5.0
+# экспоненциальная пауза между попытками: 2, 4, 8 … но не больше 10 минут
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 600.0
+
+_wakeup = asyncio.Event()
+
+
+def enqueue_register_stmt(telegram_id: int, now: dt.datetime):
+    """
+    INSERT в outbox для регистрации; выполняется в той же транзакции, что и
+    запись пользователя. Повторная регистрация перезапускает запрос.
+    """
+    return pg_insert(RegisterOutbox).values(
+        telegram_id=telegram_id,
+        requested_at=now,
+        next_attempt_at=now,
+        attempts=0,
+    ).on_conflict_do_update(
+        index_elements=[RegisterOutbox.telegram_id],
+        set_={
+            "requested_at": now,
+            "next_attempt_at": now,
+            "attempts": 0,
+            "last_error": None,
+        },
+    )
+
+
+def notify() -> None:
+    """Будит worker в этом процессе, чтобы не ждать POLL_INTERVAL."""
+    _wakeup.set()
+
+
+async def _claim() -> list[tuple[int, dt.datetime, int]]:
+    now = dt.datetime.utcnow()
+    due = (
+        select(RegisterOutbox.telegram_id)
+        .where(RegisterOutbox.next_attempt_at <= now)
+        .order_by(RegisterOutbox.next_attempt_at)
+        .limit(CLAIM_BATCH)
+        .with_for_update(skip_locked=True)
+    )
+    async with async_session() as sess:
+        result = await sess.execute(
+            update(RegisterOutbox)
+            .where(RegisterOutbox.telegram_id.in_(due.scalar_subquery()))
+            .values(next_attempt_at=now + LEASE)
+            .returning(
+                RegisterOutbox.telegram_id,
+                RegisterOutbox.requested_at,
+                RegisterOutbox.attempts,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        rows = result.all()
+        await sess.commit()
+    return [tuple(row) for row in rows]
+
+
+async def _process(bot: Bot, telegram_id: int, requested_at: dt.datetime, attempts: int) -> None:
+    try:
+        # оба вызова идемпотентны: разбан повторять безопасно,
+        # а ссылка выдаётся, только если её ещё нет
+        await bot.unban_chat_member(
+            chat_id=settings.chat_id, user_id=telegram_id, only_if_banned=True
+        )
+        async with async_session() as sess:
+            link = await sess.scalar(
+                select(User.invite_link).where(User.telegram_id == telegram_id)
+            )
+        if link is None:
+            link = await checkout_invite(bot)
+    except Exception as e:
+        delay = min(BACKOFF_BASE ** (attempts + 1), BACKOFF_MAX)
+        logger.warning(
+            "Register outbox for %s failed (attempt %d), retry in %.0fs: %s",
+            telegram_id, attempts + 1, delay, e,
+        )
+        async with async_session() as sess:
+            await sess.execute(
+                update(RegisterOutbox)
+                .where(
+                    RegisterOutbox.telegram_id == telegram_id,
+                    RegisterOutbox.requested_at == requested_at,
+                )
+                .values(
+                    attempts=attempts + 1,
+                    next_attempt_at=dt.datetime.utcnow() + dt.timedelta(seconds=delay),
+                    last_error=str(e)[:255],
+                )
+            )
+            await sess.commit()
+        return
+
+    async with async_session() as sess:
+        await sess.execute(
+            update(User)
+            .where(User.telegram_id == telegram_id, User.invite_link.is_(None))
+            .values(invite_link=link)
+        )
+        await sess.execute(notify_user_changed(telegram_id))
+        # если за это время пришла повторная регистрация, запись остаётся
+        await sess.execute(
+            delete(RegisterOutbox).where(
+                RegisterOutbox.telegram_id == telegram_id,
+                RegisterOutbox.requested_at == requested_at,
+            )
+        )
+        await sess.commit()
+
+
+async def run_register_outbox(bot: Bot) -> None:
+    """
+    Worker outbox регистраций: забирает записи (SKIP LOCKED — можно
+    запускать в нескольких копиях webapp) и выполняет вызовы Telegram
+    с повторами и экспоненциальной паузой.
+    """
+    while True:
+        try:
+            claimed = await _claim()
+        except Exception:
+            logger.exception("Register outbox claim failed")
+            claimed = []
+
+        if claimed:
+            await asyncio.gather(*(_process(bot, *row) for row in claimed))
+            continue
+
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
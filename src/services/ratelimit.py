@@ -0,0 +1,108 @@
+# services/ratelimit.py
+
+import asyncio
+import math
+import time
+from collections import OrderedDict
+
+
+class TokenBucket:
+    """
+    Глобальный лимитер отправки (token bucket).
+    :param rate: сколько токенов (сообщений) восполняется в секунду
+    :param capacity: максимальный «запас» токенов, по умолчанию — секунда работы
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        self._updated = now
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """
+        Ждёт, пока в ведре наберётся `tokens` токенов, и забирает их.
+        Ожидающие обслуживаются по очереди (FIFO).
+        """
+        tokens = min(tokens, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Останавливает выдачу токенов на `seconds` секунд (например, по RetryAfter).
+        После паузы ведро начинает наполняться с нуля, чтобы не выстрелить всплеском.
+        """
+        until = time.monotonic() + seconds
+        if until > self._paused_until:
+            self._paused_until = until
+            self._tokens = 0.0
+            self._updated = until
+
+
+class JobLimiter:
+    """
+    Собственный темп одной рассылки (max_rate или окно доставки) — поверх
+    общей очереди исходящих сообщений, которая делит бюджет бота между
+    рассылками, напоминаниями и ответами пользователям.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        # маленький запас: медленная рассылка не должна начинаться всплеском
+        self._bucket = TokenBucket(rate, capacity=max(rate, 1.0))
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        # по токену за раз: запрос дороже запаса (альбом) не должен обрезаться до него
+        for _ in range(math.ceil(tokens)):
+            await self._bucket.acquire()
+
+    def pause(self, seconds: float) -> None:
+        self._bucket.pause(seconds)
+
+
+class ChatPacer:
+    """
+    Ограничение частоты отправки в один и тот же чат
+    (Telegram допускает ~1 сообщение в секунду на чат).
+    """
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        # chat_id -> момент, начиная с которого в чат снова можно писать
+        self._next: OrderedDict[int, float] = OrderedDict()
+
+    def _evict(self, now: float) -> None:
+        while self._next:
+            chat_id, ready = next(iter(self._next.items()))
+            if ready > now:
+                break
+            del self._next[chat_id]
+
+    async def wait(self, chat_id: int) -> None:
+        now = time.monotonic()
+        self._evict(now)
+        ready = self._next.get(chat_id, now)
+        self._next[chat_id] = max(ready, now) + self.interval
+        self._next.move_to_end(chat_id)
+        if ready > now:
+            await asyncio.sleep(ready - now)
+
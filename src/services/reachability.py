@@ -0,0 +1,54 @@
+# services/reachability.py
+
+import asyncio
+import datetime as dt
+import logging
+from collections import defaultdict
+
+from sqlalchemy import update
+
+from ..db import async_session
+from ..models import User
+
+logger = logging.getLogger(__name__)
+
+# сколько недостижимых пользователей копим перед записью в БД
+FLUSH_BATCH = 100
+
+
+class UnreachableMarker:
+    """
+    Помечает в users пользователей, которым нельзя доставить сообщение
+    (заблокировали бота, удалили аккаунт). Такие пользователи исключаются
+    из аудитории рассылок и напоминаний до следующего /start.
+    Запись идёт пачками — подходит как колбэк on_unreachable рассылки.
+    """
+
+    def __init__(self):
+        self._pending: dict[int, str] = {}
+        self._lock = asyncio.Lock()
+
+    async def add(self, telegram_id: int, reason: str) -> None:
+        self._pending[telegram_id] = reason
+        if len(self._pending) >= FLUSH_BATCH:
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            by_reason: dict[str, list[int]] = defaultdict(list)
+            for telegram_id, reason in pending.items():
+                by_reason[reason].append(telegram_id)
+            now = dt.datetime.utcnow()
+            async with async_session() as sess:
+                for reason, ids in by_reason.items():
+                    await sess.execute(
+                        update(User)
+                        .where(User.telegram_id.in_(ids))
+                        .values(unreachable_at=now, unreachable_reason=reason)
+                    )
+                await sess.commit()
+            logger.info("Marked %d users as unreachable", len(pending))
+
@@ -0,0 +1,167 @@
+# services/telegram.py
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, asdict
+
+from aiohttp import ClientSession, TraceConfig
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+from aiogram import __version__ as aiogram_version
+from aiogram import Bot
+from aiogram.client.bot import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.enums.parse_mode import ParseMode
+
+from ..config import settings
+from ..db import log_db_pool_stats
+from .outbound import OutboundMiddleware, PriorityLimiter
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PoolStats:
+    """Счётчики использования пула соединений к Bot API."""
+    created: int = 0           # открыто новых соединений (TCP + TLS)
+    reused: int = 0            # запросов ушло по уже открытому соединению
+    queued: int = 0            # сколько раз запрос ждал свободного слота пула
+    queued_seconds: float = 0  # суммарное время ожидания слота
+    in_use: int = 0            # соединений занято прямо сейчас
+    limit: int = 0
+
+
+class PooledAiohttpSession(AiohttpSession):
+    """
+    AiohttpSession с настраиваемым пулом соединений (лимит, keep-alive)
+    и метриками пула через aiohttp TraceConfig.
+    """
+
+    def __init__(self, *, limit: int, keepalive: float, timeout: float, **kwargs):
+        super().__init__(timeout=timeout, **kwargs)
+        self._connector_init.update(
+            limit=limit,
+            limit_per_host=limit,
+            keepalive_timeout=keepalive,
+        )
+        self._stats = PoolStats(limit=limit)
+
+    def _trace_config(self) -> TraceConfig:
+        stats = self._stats
+        trace = TraceConfig()
+
+        async def on_queued_start(session, ctx, params):
+            ctx.queued_at = time.monotonic()
+
+        async def on_queued_end(session, ctx, params):
+            stats.queued += 1
+            stats.queued_seconds += time.monotonic() - ctx.queued_at
+
+        async def on_create_end(session, ctx, params):
+            stats.created += 1
+
+        async def on_reuse(session, ctx, params):
+            stats.reused += 1
+
+        trace.on_connection_queued_start.append(on_queued_start)
+        trace.on_connection_queued_end.append(on_queued_end)
+        trace.on_connection_create_end.append(on_create_end)
+        trace.on_connection_reuseconn.append(on_reuse)
+        return trace
+
+    async def create_session(self) -> ClientSession:
+        if self._should_reset_connector:
+            await self.close()
+
+        if self._session is None or self._session.closed:
+            # как в AiohttpSession, но с трассировкой соединений
+            self._session = ClientSession(
+                connector=self._connector_type(**self._connector_init),
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{aiogram_version}"},
+                trace_configs=[self._trace_config()],
+            )
+            self._should_reset_connector = False
+
+        return self._session
+
+    def stats(self) -> PoolStats:
+        connector = self._session.connector if self._session else None
+        # у TCPConnector нет публичного счётчика занятых соединений
+        self._stats.in_use = len(getattr(connector, "_acquired", ()))
+        return self._stats
+
+
+_bot: Bot | None = None
+
+
+def outbound_rate() -> float:
+    """
+    Доля telegram_rate этого процесса. Лимит Telegram — на бота целиком,
+    а очередь исходящих у каждого процесса своя, поэтому бюджет делится
+    поровну: процессы бота (bot_workers) и webapp. Приоритет действует
+    внутри процесса; рассылка в одном процессе не трогает долю других.
+    """
+    processes = settings.telegram_processes or settings.bot_workers + 1
+    return settings.telegram_rate / processes
+
+
+def get_bot() -> Bot:
+    """
+    Общий на процесс бот: polling, webapp и планировщик ходят в Bot API
+    через одну сессию и один пул соединений, без лишних TLS-рукопожатий,
+    и через одну очередь исходящих сообщений с приоритетами (см. outbound).
+    """
+    global _bot
+    if _bot is None:
+        session = PooledAiohttpSession(
+            limit=settings.telegram_pool_limit,
+            keepalive=settings.telegram_keepalive,
+            timeout=settings.telegram_timeout,
+        )
+        rate = outbound_rate()
+        session.middleware(OutboundMiddleware(PriorityLimiter(rate)))
+        logger.info("Outbound budget: %.1f msg/s in this process (TELEGRAM_RATE=%s)", rate, settings.telegram_rate)
+        _bot = Bot(
+            token=settings.bot_token,
+            session=session,
+            default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+        )
+    return _bot
+
+
+async def close_bot() -> None:
+    global _bot
+    if _bot is not None:
+        log_pool_stats()
+        await _bot.session.close()
+        _bot = None
+
+
+def outbound_stats() -> dict | None:
+    """Метрики очереди исходящих сообщений по приоритетам."""
+    if _bot is None:
+        return None
+    for middleware in _bot.session.middleware:
+        if isinstance(middleware, OutboundMiddleware):
+            return middleware.snapshot()
+    return None
+
+
+def log_pool_stats() -> None:
+    if _bot is None or not isinstance(_bot.session, PooledAiohttpSession):
+        return
+    logger.info("Telegram pool: %s", asdict(_bot.session.stats()))
+    logger.info("Telegram outbound: %s", outbound_stats())
+
+
+async def report_pool_stats(interval: float = 300) -> None:
+    """
+    Периодически пишет метрики пулов (Bot API и Postgres) и очереди исходящих
+    сообщений в лог — по ним подбираются telegram_pool_limit, telegram_rate
+    и db_pool_size / db_max_overflow.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        log_pool_stats()
+        log_db_pool_stats()
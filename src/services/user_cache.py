@@ -0,0 +1,120 @@
+# services/user_cache.py
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import asyncpg
+from sqlalchemy import select, func
+
+from ..config import settings
+from ..db import asyncpg_dsn
+
+logger = logging.getLogger(__name__)
+
+# канал Postgres, в который пишется telegram_id изменившегося пользователя
+CHANNEL = "user_state"
+# пауза перед переподключением слушателя
+RECONNECT_DELAY = 5.0
+
+
+@dataclass(frozen=True)
+class UserState:
+    """То, что нужно webapp для выбора страницы: анкета заполнена + ссылка."""
+    complete: bool
+    invite_link: str | None = None
+
+
+class UserStateCache:
+    """
+    Ограниченный по размеру (LRU) кэш состояния пользователей с TTL.
+    TTL — страховка на случай потерянного уведомления об изменении.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[int, tuple[float, UserState | None]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, telegram_id: int) -> tuple[bool, UserState | None]:
+        """Возвращает (найдено, состояние); состояние None — пользователя нет."""
+        item = self._data.get(telegram_id)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[telegram_id]
+            self.misses += 1
+            return False, None
+        self._data.move_to_end(telegram_id)
+        self.hits += 1
+        return True, item[1]
+
+    def put(self, telegram_id: int, state: UserState | None) -> None:
+        self._data[telegram_id] = (time.monotonic() + self.ttl, state)
+        self._data.move_to_end(telegram_id)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, telegram_id: int) -> None:
+        self._data.pop(telegram_id, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 3) if total else None,
+        }
+
+
+user_state_cache = UserStateCache(settings.user_cache_size, settings.user_cache_ttl)
+
+
+def notify_user_changed(telegram_id: int):
+    """
+    SELECT pg_notify(...) — выполняется в транзакции, изменившей пользователя;
+    уведомление уходит слушателям только после COMMIT.
+    """
+    return select(func.pg_notify(CHANNEL, str(telegram_id)))
+
+
+async def listen_user_changes() -> None:
+    """
+    Слушает канал изменений пользователей и сбрасывает записи кэша:
+    так бот (/start) и другие копии webapp инвалидируют кэш этого процесса.
+    """
+    dsn = asyncpg_dsn()
+
+    def on_notify(conn, pid, channel, payload):
+        user_state_cache.invalidate(int(payload))
+
+    while True:
+        try:
+            conn = await asyncpg.connect(dsn)
+        except (OSError, asyncpg.PostgresError) as e:
+            logger.warning("User cache listener cannot connect: %s", e)
+            await asyncio.sleep(RECONNECT_DELAY)
+            continue
+
+        closed = asyncio.Event()
+        conn.add_termination_listener(lambda c: closed.set())
+        try:
+            await conn.add_listener(CHANNEL, on_notify)
+            # пока не слушали, уведомления могли потеряться
+            user_state_cache.clear()
+            await closed.wait()
+            logger.warning("User cache listener disconnected, reconnecting")
+        finally:
+            await conn.close()
+        await asyncio.sleep(RECONNECT_DELAY)
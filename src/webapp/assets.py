@@ -0,0 +1,114 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from dataclasses import dataclass, field
+
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+from starlette.types import Scope
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен — без него отдаём только gzip
+    brotli = None
+
+# что имеет смысл сжимать; PDF и картинки уже сжаты
+COMPRESSIBLE = {"text/css", "text/html", "text/javascript", "application/javascript",
+                "image/svg+xml", "application/json"}
+# версионированный URL (?v=<hash>) никогда не меняет содержимое
+IMMUTABLE = "public, max-age=31536000, immutable"
+# без версии — кэшируем, но сверяемся по ETag
+REVALIDATE = "public, max-age=0, must-revalidate"
+
+
+@dataclass
+class Asset:
+    content_type: str
+    digest: str
+    version: str
+    # кодировка ('identity', 'gzip', 'br') -> тело ответа
+    bodies: dict[str, bytes] = field(default_factory=dict)
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles, который при старте читает каталог в память, считает ETag
+    и заранее готовит gzip/brotli варианты текстовых файлов.
+    `url(path)` отдаёт версионированный URL для шаблонов.
+    """
+
+    def __init__(self, *, directory: str, prefix: str = "/static", **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.prefix = prefix
+        self.assets: dict[str, Asset] = {}
+        for root, _, files in os.walk(directory):
+            for name in files:
+                full_path = os.path.join(root, name)
+                rel_path = os.path.relpath(full_path, directory)
+                self.assets[rel_path] = self._load(full_path)
+
+    @staticmethod
+    def _load(full_path: str) -> Asset:
+        with open(full_path, "rb") as f:
+            body = f.read()
+        digest = hashlib.sha256(body).hexdigest()
+        content_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+        asset = Asset(
+            content_type=content_type,
+            digest=digest[:32],
+            version=digest[:12],
+            bodies={"identity": body},
+        )
+        if content_type in COMPRESSIBLE:
+            asset.bodies["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                asset.bodies["br"] = brotli.compress(body)
+        return asset
+
+    def url(self, path: str) -> str:
+        asset = self.assets.get(os.path.normpath(path))
+        if asset is None:
+            return f"{self.prefix}/{path}"
+        return f"{self.prefix}/{path}?v={asset.version}"
+
+    @staticmethod
+    def _etag(asset: Asset, encoding: str) -> str:
+        # у каждого представления свой сильный ETag (RFC 9110, 8.8.3)
+        if encoding == "identity":
+            return f'"{asset.digest}"'
+        return f'"{asset.digest}-{encoding}"'
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        asset = self.assets.get(path)
+        if asset is None:
+            return await super().get_response(path, scope)
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+
+        request_headers = Headers(scope=scope)
+        accepted = request_headers.get("accept-encoding", "")
+        encoding = "identity"
+        for candidate in ("br", "gzip"):
+            if candidate in asset.bodies and candidate in accepted:
+                encoding = candidate
+                break
+
+        versioned = f"v={asset.version}" in scope.get("query_string", b"").decode()
+        headers = {
+            "etag": self._etag(asset, encoding),
+            "cache-control": IMMUTABLE if versioned else REVALIDATE,
+            "vary": "Accept-Encoding",
+        }
+        if self.is_not_modified(Headers(headers), request_headers):
+            return NotModifiedResponse(Headers(headers))
+        if encoding != "identity":
+            headers["content-encoding"] = encoding
+
+        body = asset.bodies[encoding]
+        if scope["method"] == "HEAD":
+            headers["content-length"] = str(len(body))
+            body = b""
+        return Response(body, media_type=asset.content_type, headers=headers)
@@ -1,16 +1,24 @@
+import asyncio
 import logging
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from datetime import datetime
+
 from fastapi import FastAPI, Request, Depends, HTTPException
 from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from sqlalchemy import select
-from aiogram import Bot
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from ..config import settings
-from ..db import async_session
-from ..models import User
-from ..services.invite import create_one_time_invite
+from ..db import async_session, db_pool_stats
+from ..models import User, RegisterOutbox
+from ..services.outbox import enqueue_register_stmt, notify as notify_outbox, run_register_outbox
+from ..services.telegram import get_bot, close_bot, report_pool_stats, outbound_stats
+from ..services.user_cache import (
+    UserState, user_state_cache, notify_user_changed, listen_user_changes,
+)
+from .assets import CachedStaticFiles
 
 # ---------------------------------------------------------------------------
 # Logging configuration
@@ -21,10 +29,55 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
-app.mount("/static", StaticFiles(directory="src/webapp/static"), name="static")
-templates = Jinja2Templates(directory="src/webapp/templates")
-bot = Bot(token=settings.bot_token)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # разбан и ссылки после регистрации выполняются в фоне
+    background = [
+        asyncio.create_task(run_register_outbox(bot)),
+        # инвалидация кэша пользователей по изменениям из бота и других копий
+        asyncio.create_task(listen_user_changes()),
+        asyncio.create_task(report_pool_stats()),
+    ]
+    if webhook is not None:
+        await webhook.start()
+    yield
+    if webhook is not None:
+        await webhook.stop()
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    # закрываем пул соединений к Bot API
+    await close_bot()
+
+
+app = FastAPI(lifespan=lifespan)
+static = CachedStaticFiles(directory="src/webapp/static")
+app.mount("/static", static, name="static")
+bot = get_bot()
+
+# в webhook-режиме это же приложение принимает апдейты бота
+webhook = None
+if settings.bot_mode == "webhook":
+    from ..bot import create_dispatcher
+    from ..webhook import WebhookProcessor
+
+    webhook = WebhookProcessor(
+        create_dispatcher(bot), bot,
+        workers=settings.webhook_workers,
+        queue_size=settings.webhook_queue_size,
+    )
+    app.include_router(webhook.router())
+
+# шаблоны компилируются один раз; ссылки на статику — с версией по хэшу
+templates = Environment(
+    loader=FileSystemLoader("src/webapp/templates"),
+    autoescape=select_autoescape(),
+)
+templates.globals["static_url"] = static.url
+# форма одинакова для всех — рендерим её один раз при старте
+FORM_HTML = templates.get_template("form.html").render()
+success_template = templates.get_template("success.html")
 
 
 def get_telegram_user_id(request: Request) -> int:
@@ -41,32 +94,33 @@ def get_telegram_user_id(request: Request) -> int:
 async def index(request: Request, uid: int = Depends(get_telegram_user_id)):
     logger.info("Handling index GET for user %s", uid)
 
-    async with async_session() as sess:
-        user = await sess.scalar(
-            select(User).where(User.telegram_id == uid)
-        )
+    found, state = user_state_cache.get(uid)
+    if not found:
+        async with async_session() as sess:
+            row = (await sess.execute(
+                select(User.fio, User.specialization, User.invite_link)
+                .where(User.telegram_id == uid)
+            )).first()
+        state = None
+        if row is not None:
+            state = UserState(
+                complete=row.fio is not None and row.specialization is not None,
+                invite_link=row.invite_link,
+            )
+        user_state_cache.put(uid, state)
 
     # Если пользователя нет или он не заполнил fio или specialization — показываем форму
-    if not user or user.fio is None or user.specialization is None:
+    if state is None or not state.complete:
         logger.info(
             "User %s incomplete (%s); returning registration form",
             uid,
-            f"fio={user.fio!r}, specialization={user.specialization!r}" if user else "no user",
-        )
-        return templates.TemplateResponse(
-            "form.html",
-            {"request": request}
+            "no user" if state is None else "profile not filled",
         )
+        return HTMLResponse(FORM_HTML)
 
     # Иначе — показываем страницу успеха с invite_link
     logger.info("User %s fully registered; returning success template", uid)
-    return templates.TemplateResponse(
-        "success.html",
-        {
-            "request": request,
-            "invite_link": user.invite_link
-        }
-    )
+    return HTMLResponse(success_template.render(invite_link=state.invite_link))
 
 
 @app.post("/register")
@@ -76,33 +130,57 @@ async def register(request: Request):
     if tg_id == 0:
         raise HTTPException(400, "telegram_id is required")
 
-    await bot.unban_chat_member(chat_id=settings.chat_id, user_id=tg_id)
-
-    # 1) Создаём новую одноразовую ссылку
-    invite = await create_one_time_invite(bot)
-
-    # 2) UPSERT: вставляем или обновляем все поля, включая новую invite_link
+    # 1) UPSERT: вставляем или обновляем поля анкеты
     stmt = pg_insert(User).values(
         telegram_id      = tg_id,
         username         = data.get("username"),
         fio              = data.get("fio"),
         specialization   = data.get("specialization"),
         email            = data.get("email"),
-        invite_link      = invite,
     ).on_conflict_do_update(
         index_elements=[User.telegram_id],
         set_ = {
             "fio"            : data.get("fio"),
             "specialization" : data.get("specialization"),
             "email"          : data.get("email"),
-            "invite_link"    : invite,
         }
-    ).returning(User.invite_link)
+    )
 
-    # 3) Выполняем запрос и возвращаем новую ссылку
+    # 2) В той же транзакции ставим разбан и выдачу ссылки в outbox —
+    #    вызовы Telegram выполнит worker, ответ не ждёт их
     async with async_session() as sess:
-        result     = await sess.execute(stmt)
-        new_link   = result.scalar_one()
+        await sess.execute(stmt)
+        await sess.execute(enqueue_register_stmt(tg_id, datetime.utcnow()))
+        await sess.execute(notify_user_changed(tg_id))
         await sess.commit()
+    user_state_cache.invalidate(tg_id)
+    notify_outbox()
+
+    # 3) Ссылку страница получает опросом /invite
+    return {"status": "pending"}
 
-    return {"link": new_link}
\ No newline at end of file
+
+@app.get("/invite")
+async def invite(uid: int = Depends(get_telegram_user_id)):
+    """Ссылка готова, когда outbox по пользователю выполнен."""
+    async with async_session() as sess:
+        link = await sess.scalar(
+            select(User.invite_link).where(User.telegram_id == uid)
+        )
+        pending = await sess.scalar(
+            select(RegisterOutbox.telegram_id).where(RegisterOutbox.telegram_id == uid)
+        )
+    if pending is not None or link is None:
+        return {"status": "pending"}
+    return {"status": "ready", "link": link}
+
+
+@app.get("/stats")
+async def stats():
+    """Счётчики кэша, пулов соединений и очереди сообщений этого процесса для мониторинга."""
+    return {
+        "user_cache": user_state_cache.stats(),
+        "db_pool": asdict(db_pool_stats()),
+        "telegram_pool": asdict(bot.session.stats()),
+        "telegram_outbound": outbound_stats(),
+    }
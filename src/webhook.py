@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import secrets
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from fastapi import APIRouter, Request, Response, HTTPException
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookProcessor:
+    """
+    Приём апдейтов Telegram через webhook: запрос только проверяется и
+    кладётся в ограниченную очередь, ответ 200 уходит сразу. Обработку
+    ведут `workers` фоновых задач, поэтому медленные хендлеры (рассылка,
+    экспорт) не задерживают подтверждение. Если очередь полна, отвечаем 503 —
+    Telegram повторит доставку позже.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, *, workers: int, queue_size: int):
+        self.dp = dp
+        self.bot = bot
+        self.workers = workers
+        self._queue: asyncio.Queue[Update] = asyncio.Queue(maxsize=queue_size)
+        self._tasks: list[asyncio.Task] = []
+
+    def router(self) -> APIRouter:
+        router = APIRouter()
+
+        @router.post(settings.webhook_path, include_in_schema=False)
+        async def telegram_webhook(request: Request) -> Response:
+            token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+            # секрет задан всегда (см. Settings._check_webhook)
+            if not secrets.compare_digest(token.encode(), settings.webhook_secret.encode()):
+                raise HTTPException(401, "bad secret token")
+
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+            try:
+                self._queue.put_nowait(update)
+            except asyncio.QueueFull:
+                logger.warning("Webhook queue is full, asking Telegram to retry update %s", update.update_id)
+                return Response(status_code=503)
+            return Response(status_code=200)
+
+        return router
+
+    async def _worker(self) -> None:
+        while True:
+            update = await self._queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception:
+                logger.exception("Failed to process update %s", update.update_id)
+            finally:
+                self._queue.task_done()
+
+    async def start(self) -> None:
+        workflow_data = {"dispatcher": self.dp, **self.dp.workflow_data}
+        await self.dp.emit_startup(bot=self.bot, **workflow_data)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        await self.bot.set_webhook(
+            url=f"{settings.webhook_url.rstrip('/')}{settings.webhook_path}",
+            secret_token=settings.webhook_secret,
+            allowed_updates=self.dp.resolve_used_update_types(),
+            max_connections=min(self.workers * 2, 100),
+        )
+        logger.info("Webhook set, %d workers", self.workers)
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        # даём доработать уже принятым апдейтам
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Webhook stopped with %d unprocessed updates", self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        workflow_data = {"dispatcher": self.dp, **self.dp.workflow_data}
+        await self.dp.emit_shutdown(bot=self.bot, **workflow_data)